@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2014 Eugene Marchukov
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Benchmark of the routing in full_update on a synthetic tree
+
+The tree is made in memory and walked by a stand-in of os.walk, so the
+numbers are of the filters and the path rewriting only. The old code is
+kept here as the baseline; both must give the same CopyFiles.txt.
+"""
+import argparse
+import ntpath
+import os
+import random
+import time
+from unittest import mock
+
+from cfm import project
+from cfm.project import Project
+from cfm.route import Filter
+
+SOURCE = 'c:\\store\\jbc'
+
+
+def synthetic_tree(count, seed=0, width=40):
+    '''{folder: (dirs, files)} of about count files like a firmware tree'''
+    rnd = random.Random(seed)
+    top = ('NAND\\DATA', 'NAND\\NAND', 'NAND\\System', 'tools', 'Storage')
+    exts = ('.bin', '.dat', '.snd', '.exe', '.dll', '.txt', '.bmp', '.bak')
+    tree = {SOURCE: ([], ['update.bin', 'update.cde', 'NK.bin'])}
+    folders = [SOURCE]
+    for path in top:
+        parent = SOURCE
+        for part in path.split('\\'):
+            folder = parent + '\\' + part
+            if folder not in tree:
+                tree[parent][0].append(part)
+                tree[folder] = ([], [])
+                folders.append(folder)
+            parent = folder
+    files = 3
+    while files < count:
+        parent = rnd.choice(folders)
+        folder = parent + '\\' + 'd%05i' % len(folders)
+        tree[parent][0].append(os.path.basename(folder.replace('\\', '/')))
+        names = ['f%03i%s' % (i, rnd.choice(exts))
+                 for i in range(rnd.randrange(1, 2 * width))]
+        tree[folder] = ([], names)
+        files += len(names)
+        folders.append(folder)
+        if rnd.random() < 0.05:
+            tree[parent][0].append('.svn')
+            tree[parent + '\\.svn'] = ([], ['entries', 'wc.db'])
+    return tree
+
+
+def walker(tree):
+    '''os.walk over the tree, pruned by the dirs the caller keeps'''
+    def walk(top, *ignored, **ignored_too):
+        dirs, files = tree[top]
+        dirs, files = list(dirs), list(files)
+        yield top, dirs, files
+        for d in dirs:
+            yield from walk(top + '\\' + d)
+    return walk
+
+
+def baseline(config):
+    '''The CopyFiles.txt lines as full_update made them before'''
+    lines = []
+    for root, dirs, files in os.walk(config.source):
+        for d in dirs:
+            if d in config.bad_dirs: dirs.remove(d)
+        for file_ in files:
+            if file_ not in config.bad_files:
+                file_ = os.path.join(root, file_)
+                t = file_.replace(config.source, config.target, 1)
+                a = file_.replace(config.source, config.source_prefix, 1)
+                b = file_.replace(config.source, config.target_prefix, 1)
+                for r in config.replacements:
+                    b = b.replace(r[0], r[1], 1)
+                os.path.normpath(t)
+                lines.append((os.path.normpath(a), os.path.normpath(b)))
+    return lines
+
+
+def compiled(config):
+    '''The CopyFiles.txt lines as full_update makes them now'''
+    config._Project__compile()
+    route = config._Project__route
+    return [route(f)[1] for f in config._Project__files()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--files', type=int, default=500000,
+                        help='files in the synthetic tree')
+    args = parser.parse_args()
+    tree = synthetic_tree(args.files)
+    config = Project(append='no', bad_dirs='.svn,tools',
+                     bad_files='update.bin,update.cde,NK.bin',
+                     file_list=None, order='CopyFiles.txt',
+                     replacements='\\NAND\\DATA>\\DATA,\\NAND\\NAND>\\NAND',
+                     source=SOURCE, source_prefix='\\Storage Card\\',
+                     target='k:\\', target_prefix='\\')
+    results = {}
+    # The tree is a Windows one, whatever this system is. project.os is
+    # the os module, it is patched only while the routes are made.
+    with mock.patch.object(project.os, 'path', ntpath), \
+            mock.patch.object(project.os, 'sep', '\\'), \
+            mock.patch.object(project.os, 'altsep', '/'), \
+            mock.patch.object(project.os, 'walk', walker(tree)):
+        for label, run in (('baseline', baseline), ('compiled', compiled)):
+            start = time.perf_counter()
+            results[label] = run(config)
+            print('%-8s %8.3f s %8i files' % (
+                  label, time.perf_counter() - start, len(results[label])))
+    assert results['baseline'] == results['compiled'], 'the orders differ'
+    # The globs cost a regular expression match per name not in the set.
+    bad = Filter(['.svn', 'tools', '*.bak', '~*'])
+    names = [n for dirs, files in tree.values() for n in dirs + files]
+    start = time.perf_counter()
+    found = sum(1 for n in names if bad(n))
+    print('globs    %8.3f s %8i names, %i bad' % (
+          time.perf_counter() - start, len(names), found))
+
+
+if __name__ == '__main__':
+    main()
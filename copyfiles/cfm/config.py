@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+from .xerox import WORKERS
 
 
 DELIMITER_1 = ","
@@ -37,7 +38,8 @@ class Config(object):
 
     def __init__(self, *ignored, append, bad_dirs, bad_files, file_list,
                  order, replacements, source, source_prefix, target,
-                 target_prefix, msg=None):
+                 target_prefix, sort=None, sync=None, workers=None,
+                 msg=None):
         '''
         Constructor
         '''
@@ -51,16 +53,20 @@ class Config(object):
         self.source_prefix = source_prefix
         self.target = target
         self.target_prefix = target_prefix
+        self.sort = sort
+        self.sync = sync
+        self.workers = workers
         self.msg = msg
 
 
     def __str__(self):
         options = ('append', 'bad_dirs', 'bad_files', 'file_list', 'order',
                    'replacements', 'source', 'source_prefix', 'target',
-                   'target_prefix')
+                   'target_prefix', 'sort', 'sync', 'workers')
         values = (self.append, self.bad_dirs, self.bad_files, self.file_list,
                   self.order, self.replacements, self.source,
-                  self.source_prefix, self.target, self.target_prefix)
+                  self.source_prefix, self.target, self.target_prefix,
+                  self.sort, self.sync, self.workers)
         return '\n'.join(sorted(['{0}: {1}'.format(k, v)
                                  for (k, v) in zip(options, values)]))
 
@@ -168,6 +174,39 @@ class Config(object):
         self.__target_prefix = value
 
 
+    @property
+    def sort(self):
+        return self.__sort
+    
+    @sort.setter
+    def sort(self, value):
+        self.__sort = getboolean(value)
+
+
+    @property
+    def sync(self):
+        return self.__sync
+    
+    @sync.setter
+    def sync(self, value):
+        # no: copy all, yes or mtime: by size and time, hash: and by SHA-1
+        if value is not None and value.lower() in ('hash', 'mtime'):
+            self.__sync = value.lower()
+        elif getboolean(value):
+            self.__sync = 'mtime'
+        else:
+            self.__sync = None
+
+
+    @property
+    def workers(self):
+        return self.__workers
+    
+    @workers.setter
+    def workers(self, value):
+        self.__workers = int(value) if value else WORKERS
+
+
     @property
     def file_list(self):
         return self.__file_list
@@ -33,7 +33,10 @@ def make_sample_config(file_name):
     config['DEFAULT'] = {'append': 'no',
                          'bad_dirs': '.svn',
                          'order': 'CopyFiles.txt',
-                         'source_prefix': 'StorageCard'}
+                         'source_prefix': 'StorageCard',
+                         'sort': 'no',
+                         'sync': 'no',
+                         'workers': '4'}
     config['example'] = {'source': 'c:\\temp',
                          'target': 'd:\\temp',
                          'file_list': 'svn_log.txt',
@@ -113,7 +116,7 @@ class Manager(object):
             raise ConfigSectionError
         options = ('append', 'bad_dirs', 'bad_files', 'order', 'file_list',
                    'replacements', 'source', 'source_prefix', 'target',
-                   'target_prefix')
+                   'target_prefix', 'sort', 'sync', 'workers')
         cfg = {option: self.__config.get(value, option, fallback=None)
                for option in options}
         cfg['msg'] = self.__msg
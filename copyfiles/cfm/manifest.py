@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2014 Eugene Marchukov
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST = '.copyfiles.json'
+BUFFER = 1 << 20
+
+
+def digest(filename):
+    '''The SHA-1 of the contents of a file'''
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(BUFFER), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class Manifest(object):
+    '''
+    The files copied to a target: {relative path: [size, mtime, sha1]}
+    of the source file each one was copied from
+
+    It is kept in the target folder, so it travels with an SD card.
+    '''
+
+    def __init__(self, target):
+        '''
+        Constructor
+        '''
+        self.__target = target
+        self.__file = os.path.join(target, MANIFEST)
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        try:
+            with open(self.__file, 'rt', encoding='utf-8') as fp:
+                self.__entries = json.load(fp)
+        except (IOError, ValueError):
+            pass
+
+
+    @property
+    def file(self):
+        return self.__file
+
+
+    def key(self, dst):
+        return os.path.relpath(dst, self.__target).replace(os.sep, '/')
+
+
+    def get(self, dst):
+        with self.__lock:
+            return self.__entries.get(self.key(dst))
+
+    def put(self, dst, entry):
+        with self.__lock:
+            self.__entries[self.key(dst)] = entry
+
+    def remove(self, dst):
+        with self.__lock:
+            self.__entries.pop(self.key(dst), None)
+
+
+    def save(self):
+        temp = self.__file + '.tmp'
+        with self.__lock:
+            with open(temp, 'wt', encoding='utf-8') as fp:
+                json.dump(self.__entries, fp, sort_keys=True)
+        os.replace(temp, self.__file)
@@ -13,6 +13,7 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import collections
 import queue
 import threading
 from abc import abstractmethod
@@ -27,7 +28,8 @@ class MultifunctionDevice(threading.Thread):
         '''
         Constructor
         '''
-        super().__init__() # threading.Thread.__init__(self)
+        # A device left waiting for its data must not keep the app alive.
+        super().__init__(daemon=True)
 
     
     @property
@@ -36,7 +38,21 @@ class MultifunctionDevice(threading.Thread):
     
     @data.setter
     def data(self, items):
-        self.__data = [i for i in items]
+        '''Items in order, or a queue.Queue of them ended by None'''
+        if isinstance(items, queue.Queue):
+            self.__data = items
+        else:
+            self.__data = collections.deque(items)
+
+
+    def items(self):
+        '''Yield the items of data in order, as they come from a queue'''
+        data = self.data
+        if isinstance(data, queue.Queue):
+            yield from iter(data.get, None)
+        else:
+            while data:
+                yield data.popleft()
 
 
     @property
@@ -49,7 +65,7 @@ class MultifunctionDevice(threading.Thread):
 
     @abstractmethod
     def run(self):
-        while self.data:
-            self.display.put(self.data.pop())
+        for item in self.items():
+            self.display.put(item)
         self.display.put('*** All done ***')
 
@@ -58,8 +58,15 @@ class Printer(MultifunctionDevice):
 
 
     def run(self):
-        while self.data:
-            src, dst = self.data.pop()
-            print(src, dst, sep=';', file=self.paper)
-        self.__paper.close()
+        # A line which cannot be written is reported, the others still are:
+        # the producer waits for the queue to be drained to the end.
+        try:
+            for src, dst in self.items():
+                try:
+                    print(';'.join((src, dst)), file=self.paper)
+                except (OSError, ValueError) as e:
+                    self.display.put('Not in the order: {0}: {1}'.format(
+                                     src, e))
+        finally:
+            self.__paper.close()
         self.display.put('*** CopyFile creation is done ***')
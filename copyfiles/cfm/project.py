@@ -14,10 +14,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import queue
+import shutil
+import functools
+import threading
+from cfm import svnlog
+from cfm.route import Filter, Router
 from cfm.xerox import Xerox
-from cfm.printer import Printer
+from cfm.printer import Printer, CODEPAGE
 from cfm.config import Config
 
+QUEUE = 1000   # the pairs on the way to the Printer and to the Xerox
+TIMEOUT = 1    # seconds between the checks that the devices are alive
+
+reader = functools.partial(open, mode="rt", encoding=CODEPAGE)
+
 class Project(Config):
     '''
     classdocs
@@ -29,49 +40,168 @@ class Project(Config):
         super().__init__(**kwargs)
 
 
+    def __compile(self):
+        '''The router and the filters of the options as they are now'''
+        self.__route = Router(self.source, self.target, self.source_prefix,
+                              self.target_prefix, self.replacements).route
+        self.__bad_dir = Filter(self.bad_dirs)
+        self.__bad_file = Filter(self.bad_files)
+
+
     def __files(self):
+        bad_dir, bad_file = self.__bad_dir, self.__bad_file
         for root, dirs, files in os.walk(self.source):
-            for d in dirs:
-                if d in self.bad_dirs: dirs.remove(d) 
+            if self.sort:
+                # The same CopyFiles.txt for the same tree, on any disk
+                dirs.sort()
+                files.sort()
+            # In place, so the walk skips them
+            dirs[:] = [d for d in dirs if not bad_dir(d)]
             for file_ in files:
-                if file_ not in self.bad_files:
+                if not bad_file(file_):
                     yield os.path.join(root, file_)
 
 
-    def full_update(self):
-        files = []
-        orders = []
-        for file_ in self.__files():
-            t = file_.replace(self.source, self.target, 1)
-            files.append((file_, os.path.normpath(t)))
-            a = file_.replace(self.source, self.source_prefix, 1)
-            b =  file_.replace(self.source, self.target_prefix, 1)
-            for r in self.replacements:
-                b = b.replace(r[0], r[1], 1)
-            orders.append((os.path.normpath(a), os.path.normpath(b)))
+    def __bad(self, path):
+        '''True if the relative path is in a bad dir or is a bad file'''
+        parts = path.split(os.sep)
+        return (self.__bad_file(parts[-1]) or
+                any(self.__bad_dir(d) for d in parts[:-1]))
+
+
+    def __print(self, orders):
         p = Printer()
         p.display = self.msg
         p.append = self.append
         p.paper = self.order
         p.data = orders
         p.start()
-        if self.copy:
-            files.append((os.path.abspath(self.order),
-                          os.path.join(self.target,
-                          os.path.basename(self.order))))
-            x = Xerox()
-            x.display = self.msg
-            x.data = files
+        return p
+
+
+    def __xerox(self, files):
+        x = Xerox()
+        x.display = self.msg
+        x.workers = self.workers
+        x.data = files
+        return x
+
+
+    def __order_copy(self):
+        '''(source, target) to copy the order itself'''
+        return (os.path.abspath(self.order),
+                os.path.join(self.target, os.path.basename(self.order)))
+
+
+    def full_update(self):
+        '''Order and copy the files of the source tree
+
+        The walk feeds the Printer and the Xerox through bounded queues,
+        so both start at once and the memory does not grow with the tree.
+        '''
+        self.__compile()
+        orders = queue.Queue(QUEUE)
+        files = queue.Queue(QUEUE) if self.copy else None
+        p = self.__print(orders)
+        if files is not None:
+            x = self.__xerox(files)
+            x.sync = self.sync
+            x.target = self.target
             x.start()
+        else:
+            x = None
+        threading.Thread(target=self.__produce, args=(orders, files, p, x),
+                         daemon=True).start()
+
+
+    @staticmethod
+    def __put(queue_, item, device):
+        '''Put the item into the queue unless the device taking it is dead'''
+        while device.is_alive():
+            try:
+                queue_.put(item, timeout=TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def __produce(self, orders, files, printer, xerox):
+        put = self.__put
+        try:
+            for file_ in self.__files():
+                copy, order = self.__route(file_)
+                if not put(orders, order, printer):
+                    self.msg.put('The order is not written, stopped')
+                    break
+                if files is not None and not put(files, copy, xerox):
+                    self.msg.put('The files are not copied, stopped')
+                    break
+        finally:
+            put(orders, None, printer)
+            if files is not None:
+                # The order must be written before it is copied.
+                printer.join()
+                put(files, self.__order_copy(), xerox)
+                put(files, None, xerox)
 
 
     def list_update(self):
+        '''Order and copy the files touched by the svn update in file_list
+
+        The deleted files and folders are removed from the target too.
+        The work is done by a thread, the same as in full_update.
+        '''
+        if self.file_list is None:
+            self.msg.put('There is no file_list for the project')
+            return
+        self.__compile()
+        threading.Thread(target=self.__update_on_list, daemon=True).start()
+
+
+    def __update_on_list(self):
         files = []
         orders = []
+        deleted = []
+        try:
+            with reader(self.file_list) as fp:
+                changes = svnlog.latest(fp)
+        except OSError as e:
+            self.msg.put(e)
+            return
+        for path, status in changes.items():
+            file_ = os.path.join(self.source, path)
+            if self.__bad(path):
+                continue
+            elif status == svnlog.DELETED:
+                deleted.append(self.__route(file_)[0][1])
+            elif status == svnlog.CONFLICT:
+                self.msg.put('Conflict, not copied: ' + file_)
+            elif os.path.isfile(file_):
+                copy, order = self.__route(file_)
+                files.append(copy)
+                orders.append(order)
+        p = self.__print(orders)
         if self.copy:
-            files.append((os.path.abspath(self.order),
-                          os.path.join(self.target, self.order)))
-            x = Xerox()
-            x.display = self.msg
-            x.data = files
-            x.start()
+            for path in deleted:
+                self.__remove(path)
+            # The order must be written before it is copied.
+            p.join()
+            self.__xerox(files + [self.__order_copy()]).start()
+        else:
+            for path in deleted:
+                self.msg.put('Deleted in the source: ' + path)
+
+
+    def __remove(self, path):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+            else:
+                return
+        except OSError as e:
+            self.msg.put(e)
+        else:
+            self.msg.put('Deleted: ' + path)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2014 Eugene Marchukov
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import fnmatch
+import os
+import re
+
+GLOB = re.compile(r'[*?[]')
+
+
+class Filter(object):
+    '''
+    The names in a bad_dirs or bad_files list: a frozenset of the plain
+    names and one regular expression of the glob patterns ('*.bak')
+    '''
+
+    def __init__(self, patterns):
+        '''
+        Constructor
+        '''
+        names, globs = set(), []
+        for pattern in patterns:
+            if not pattern:
+                continue
+            elif GLOB.search(pattern):
+                globs.append(fnmatch.translate(pattern))
+            else:
+                names.add(pattern)
+        self.__names = frozenset(names)
+        self.__match = re.compile('|'.join(globs)).match if globs else None
+
+
+    def __call__(self, name):
+        return name in self.__names or (self.__match is not None and
+                                        self.__match(name) is not None)
+
+
+class Router(object):
+    '''
+    The target path and the order line of a source file
+
+    The same as
+
+        t = file_.replace(source, target, 1)
+        a = file_.replace(source, source_prefix, 1)
+        b = file_.replace(source, target_prefix, 1)
+        for r in replacements:
+            b = b.replace(r[0], r[1], 1)
+        (file_, normpath(t)), (normpath(a), normpath(b))
+
+    but worked out once per folder: a file only adds its name, unless a
+    replacement may match in the name, or the name decides how the path
+    is normalized.
+    '''
+
+    def __init__(self, source, target, source_prefix, target_prefix,
+                 replacements):
+        '''
+        Constructor
+        '''
+        self.__source = source
+        self.__target = target
+        self.__source_prefix = source_prefix
+        self.__target_prefix = target_prefix
+        self.__replacements = tuple(tuple(r) for r in replacements)
+        self.__seps = tuple(s for s in (os.sep, os.altsep) if s)
+        self.__folders = {}
+
+
+    def route(self, file_):
+        '''((source, target) to copy, (source, target) of the order)'''
+        i = max(file_.rfind(s) for s in self.__seps) + 1
+        name = file_[i:]
+        if (not name or name in (os.curdir, os.pardir) or
+                not file_.startswith(self.__source)):
+            return self.__route(file_)
+        folder = self.__folders.get(file_[:i])
+        if folder is None:
+            folder = self.__folders[file_[:i]] = self.__folder(file_[:i])
+        t, a, b, order, start = folder
+        if start < len(self.__replacements):
+            b = order + name
+            for old, new in self.__replacements[start:]:
+                b = b.replace(old, new, 1)
+            b = os.path.normpath(b)
+        elif b is not None:
+            b = b + name
+        else:
+            b = os.path.normpath(order + name)
+        if t is not None:
+            t = t + name
+        else:
+            t = os.path.normpath(self.__target + file_[len(self.__source):])
+        if a is not None:
+            a = a + name
+        else:
+            a = os.path.normpath(self.__source_prefix +
+                                 file_[len(self.__source):])
+        return (file_, t), (a, b)
+
+
+    def __route(self, file_):
+        '''The route worked out from scratch'''
+        t = file_.replace(self.__source, self.__target, 1)
+        a = file_.replace(self.__source, self.__source_prefix, 1)
+        b = file_.replace(self.__source, self.__target_prefix, 1)
+        for old, new in self.__replacements:
+            b = b.replace(old, new, 1)
+        return ((file_, os.path.normpath(t)),
+                (os.path.normpath(a), os.path.normpath(b)))
+
+
+    def __base(self, path):
+        '''normpath(path + name) == __base(path) + name, or None'''
+        if not path.endswith(self.__seps):
+            return None
+        path = os.path.normpath(path)
+        if path == os.curdir:
+            return ''
+        return path if path.endswith(self.__seps) else path + os.sep
+
+
+    def __folder(self, folder):
+        '''The bases of the target, the order source and target (None: the
+        name decides), the order target before the replacements not done
+        yet and the first of them'''
+        rel = folder[len(self.__source):]
+        order = self.__target_prefix + rel
+        start = 0
+        for old, new in self.__replacements:
+            # The first match in the folder is the first one in the path;
+            # if there is none, it depends on the name.
+            j = order.find(old)
+            if j < 0:
+                break
+            order = order[:j] + new + order[j + len(old):]
+            start += 1
+        return (self.__base(self.__target + rel),
+                self.__base(self.__source_prefix + rel),
+                self.__base(order), order, start)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2014 Eugene Marchukov
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import re
+
+# The status columns of "svn update" (also "svn status" and "svn diff
+# --summarize"): text, properties, lock and tree conflict, then the path
+# relative to the working copy.
+STATUS = re.compile(r'^([ADMUCGER ])([ MUCG])([ B])([ C+]) +(\S.*)$')
+DELETED = 'D'
+CONFLICT = 'C'
+
+
+def changes(lines):
+    '''
+    Yield (status, path) of the paths touched in an svn transcript
+
+    The lines are read one by one, so a transcript of any length can be
+    streamed from a file. The status is 'D' for a deleted path, 'C' for a
+    conflict and 'U' for any other change; the other lines ("Updating",
+    "Fetching external item", "At revision"...) are skipped. The paths of
+    the externals are printed from the working copy root as well.
+    '''
+    for line in lines:
+        match = STATUS.match(line.rstrip('\r\n'))
+        if match is None:
+            continue
+        text, props, lock, tree, path = match.groups()
+        path = path.replace('\\', os.sep).replace('/', os.sep)
+        if CONFLICT in (text, props, tree):
+            yield CONFLICT, path
+        elif text == ' ' and props == ' ':
+            continue
+        elif text == DELETED:
+            yield DELETED, path
+        else:
+            yield 'U', path
+
+
+def latest(lines):
+    '''{path: status} of the last change of each path, in order'''
+    result = {}
+    for status, path in changes(lines):
+        result.pop(path, None)
+        result[path] = status
+    return result
@@ -14,13 +14,64 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
-import errno
+import queue
 import shutil
+import threading
+import time
 from .mfd import MultifunctionDevice
+from .manifest import MANIFEST, Manifest, digest
+
+WORKERS = 4
+LARGE = 8 << 20     # a file this big is streamed, one at a time
+BUFFER = 1 << 20
+RATE = 2            # seconds between the progress messages
+SLACK = 2           # FAT keeps the modification time in 2 seconds
+
+
+def copy_large(src, dst):
+    '''Copy the data of a big file in the kernel if it can, else with a
+    big buffer'''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for name in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, name):
+                continue
+            offset = 0
+            try:
+                while offset < size:
+                    count = min(size - offset, BUFFER << 4)
+                    if name == 'copy_file_range':
+                        sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(),
+                                                  count, offset, offset)
+                    else:
+                        sent = os.sendfile(fdst.fileno(), fsrc.fileno(),
+                                           offset, count)
+                    if not sent:
+                        break
+                    offset += sent
+            except OSError:
+                # Not for these file systems, unless it has begun
+                if offset:
+                    raise
+                continue
+            return
+        shutil.copyfileobj(fsrc, fdst, BUFFER)
+
 
 class Xerox(MultifunctionDevice):
     '''
-    classdocs
+    Copy the (source, target) pairs with a pool of threads
+
+    The data may be a queue, so the copy starts with the first item. Each
+    target folder is made once, before the first file copied into it. The
+    small files are copied by the workers side by side, the large ones
+    are streamed one at a time.
+    The progress goes to the display every RATE seconds.
+
+    With sync a file is copied only if it is new or changed: by the size
+    and the modification time ('mtime'), and if the time differs by the
+    SHA-1 too ('hash'), kept in the manifest of the target folder. The
+    files of the target which are not in data are reported as stale.
     '''
 
     def __init__(self):
@@ -28,19 +79,196 @@ class Xerox(MultifunctionDevice):
         Constructor
         '''
         super().__init__()
+        self.__workers = WORKERS
+        self.__sync = None
+        self.__target = None
+        self.__manifest = None
+        self.__lock = threading.Lock()
+        self.__stream = threading.Lock()
+
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @workers.setter
+    def workers(self, value):
+        self.__workers = max(1, int(value))
+
+
+    @property
+    def sync(self):
+        return self.__sync
+
+    @sync.setter
+    def sync(self, value):
+        assert value in (None, 'mtime', 'hash'), 'Unknown sync mode'
+        self.__sync = value
+
+
+    @property
+    def target(self):
+        return self.__target
+
+    @target.setter
+    def target(self, value):
+        self.__target = value
 
 
     def run(self):
-        while self.data:
-            src, dst = self.data.pop()
-            self.display.put(src)
-            # Copy File [BEGIN]
+        if self.sync == 'hash' and self.target is not None:
+            self.__manifest = Manifest(self.target)
+        self.__total, self.__done, self.__failed = 0, 0, 0
+        self.__unchanged = 0
+        self.__bytes, self.__start = 0, time.time()
+        self.__shown = self.__start
+        tasks = queue.Queue(maxsize=2 * self.workers)
+        copiers = [threading.Thread(target=self.__copier, args=(tasks,),
+                                    daemon=True)
+                   for _ in range(self.workers)]
+        for copier in copiers:
+            copier.start()
+        made, wanted = set(), set()
+        for item in self.items():
+            with self.__lock:
+                self.__total += 1
+            self.__make_dir(os.path.dirname(item[1]), made)
+            if self.sync:
+                wanted.add(os.path.normcase(os.path.abspath(item[1])))
+            tasks.put(item)
+        for copier in copiers:
+            tasks.put(None)
+        for copier in copiers:
+            copier.join()
+        self.display.put(self.__progress())
+        if self.__manifest is not None:
             try:
-                shutil.copy2(src, dst)
+                self.__manifest.save()
             except IOError as e:
-                if e.errno == errno.ENOENT:
-                    path = os.path.dirname(dst)
-                    os.makedirs(path, exist_ok=True)
-                    shutil.copy2(src, dst)
-            # Copy File [END]            
+                self.display.put(e)
+        if self.sync and self.target is not None:
+            self.__report_stale(wanted)
         self.display.put('*** All files has been copied ***')
+
+
+    def __make_dir(self, path, made):
+        '''Make the folder once, before the first file copied into it'''
+        if path in made:
+            return
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            self.display.put(e)
+        while path and path not in made:
+            made.add(path)
+            path = os.path.dirname(path)
+
+
+    def __copier(self, tasks):
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+            src, dst = item
+            sha1 = None
+            try:
+                status = os.stat(src)
+                size = status.st_size
+                if self.sync:
+                    same, sha1 = self.__compare(src, dst, status)
+                    if same:
+                        self.__count(size, unchanged=True)
+                        continue
+                if size < LARGE:
+                    shutil.copy2(src, dst)
+                else:
+                    with self.__stream:
+                        copy_large(src, dst)
+                        shutil.copystat(src, dst)
+                if self.__manifest is not None:
+                    self.__manifest.put(dst, [size, status.st_mtime,
+                                              sha1 or digest(src)])
+            except OSError as e:
+                size = None
+                self.display.put(e)
+                if self.__manifest is not None:
+                    self.__manifest.remove(dst)
+            self.__count(size)
+
+
+    def __compare(self, src, dst, status):
+        '''(True if dst is the same as src, the SHA-1 of src if read)'''
+        try:
+            target = os.stat(dst)
+        except OSError:
+            return False, None
+        if status.st_size != target.st_size:
+            return False, None
+        manifest = self.__manifest
+        if abs(status.st_mtime - target.st_mtime) <= SLACK:
+            if manifest is not None:
+                # Copied without the manifest: hash the target now, the
+                # next checkout may change the time only.
+                entry = manifest.get(dst)
+                if entry is None or entry[:2] != [status.st_size,
+                                                  status.st_mtime]:
+                    manifest.put(dst, [status.st_size, status.st_mtime,
+                                       digest(dst)])
+            return True, None
+        if manifest is None:
+            return False, None
+        # The same size, another time: a new checkout of the same file?
+        sha1 = digest(src)
+        entry = manifest.get(dst)
+        if entry is None:
+            # Not in the manifest: the target itself tells.
+            if digest(dst) != sha1:
+                return False, sha1
+        elif entry[2] != sha1:
+            return False, sha1
+        manifest.put(dst, [status.st_size, status.st_mtime, sha1])
+        # Next time the time will do.
+        os.utime(dst, ns=(status.st_atime_ns, status.st_mtime_ns))
+        return True, sha1
+
+
+    def __report_stale(self, wanted):
+        stale = 0
+        for root, dirs, files in os.walk(self.target):
+            for file_ in files:
+                path = os.path.join(root, file_)
+                if (file_ != MANIFEST and
+                        os.path.normcase(os.path.abspath(path)) not in wanted):
+                    self.display.put('Stale: ' + path)
+                    stale += 1
+        if stale:
+            self.display.put('{0} stale file(s) in {1}'.format(stale,
+                                                             self.target))
+
+
+    def __count(self, size, unchanged=False):
+        with self.__lock:
+            if size is None:
+                self.__failed += 1
+            elif unchanged:
+                self.__unchanged += 1
+            else:
+                self.__done += 1
+                self.__bytes += size
+            now = time.time()
+            if now - self.__shown < RATE:
+                return
+            self.__shown = now
+            self.display.put(self.__progress())
+
+
+    def __progress(self):
+        seconds = max(time.time() - self.__start, 1e-3)
+        text = '{0}/{1} files, {2:.1f} MB, {3:.1f} MB/s'.format(
+                self.__done, self.__total, self.__bytes / 1e6,
+                self.__bytes / 1e6 / seconds)
+        if self.__unchanged:
+            text += ', {0} unchanged'.format(self.__unchanged)
+        if self.__failed:
+            text += ', {0} failed'.format(self.__failed)
+        return text
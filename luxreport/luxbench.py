@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2014 Eugene Marchukov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Benchmarks for luxreport
+
+The micro-benchmarks time the classification and the exporters on
+synthetic data. The suite (--suite) builds synthetic release archives and
+times the whole pipeline: Analizer, ReleaseCollection.refresh and every
+exporter at several scales. -o saves the results as JSON, --compare
+prints them against the results of another version.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import textwrap
+import time
+import zipfile
+
+import luxreport
+
+
+def synthetic_names(count, seed=0):
+    """Yield file names like the ones found in a release image"""
+    rnd = random.Random(seed)
+    languages = sorted(luxreport.Settings.languages)
+    numbers = sorted(luxreport.Settings.languages_by_num)
+    codes = sorted(luxreport.Settings.languages_by_iso639_2)
+    apks = sorted(luxreport.Settings.appnames) + sorted(
+                            luxreport.Settings.blacklog)
+    makers = (
+        lambda: rnd.choice(apks),
+        lambda: 'com.vendor.app%i-1.apk' % rnd.randrange(500),
+        lambda: 'db_%i_%i.snd' % (rnd.choice(numbers), rnd.randrange(50)),
+        lambda: 'phr_%02i.snd' % rnd.choice(numbers),
+        lambda: 'svox-pico1-%s-%s_0.pil' % (rnd.choice(languages),
+                                            rnd.choice(languages).upper()),
+        lambda: 'c_%s_%s.txt' % (rnd.choice(languages),
+                                 rnd.choice(languages)),
+        lambda: 's2s-mob-%s2015%s-v1.0.2.s2s' % (rnd.choice(languages),
+                                                 rnd.choice(languages)),
+        lambda: '%s.traineddata' % rnd.choice(codes),
+        lambda: 'lib%i.so' % rnd.randrange(2000),
+        lambda: 'image%i.png' % rnd.randrange(5000))
+    weights = (20, 10, 15, 5, 5, 5, 5, 5, 10, 20)
+    for maker in rnd.choices(makers, weights, k=count):
+        yield maker()
+
+
+def synthetic_releases(count, seed=0):
+    """Yield the Analizer data of count releases"""
+    rnd = random.Random(seed)
+    languages = sorted({v[0] for v in luxreport.Settings.languages.values()})
+    apps = sorted(set(luxreport.Settings.appnames.values()))
+
+    def some(items, k):
+        return ', '.join(sorted(rnd.sample(items, k), key=str.lower))
+
+    for i in range(count):
+        yield {'project_id': 'lux2_%06i_%s.7z' % (i, rnd.choice(languages)),
+               'project_model': 'Lux %i' % rnd.randrange(100),
+               'apps_ectaco': some(apps, 20),
+               'apps_other': some(apps, 40),
+               'voice_dictionary': some(languages, 4),
+               'voice_phrasebook': some(languages, 4),
+               'photo_text': some(languages, 3),
+               'ulearn': '%s-%s' % tuple(rnd.sample(languages, 2)),
+               'ulearn2': '',
+               'feature_tts': some(languages, 2),
+               'feature_sr': some(languages, 2),
+               'feature_gt': '',
+               'feature_jibbigo': some(languages, 2),
+               'sd_size': '%.2f GB' % rnd.uniform(0, 8)}
+
+
+# Where the files of a release go by the extension, in the image and on the
+# SD card (None: not there); the other apps are in system/app.
+_PLACES = {'.apk': ('system/app', None),
+           '.so': ('system/lib', None),
+           '.png': ('data/images', None),
+           '.pil': ('system/tts', None),
+           '.snd': (None, 'snd'),
+           '.txt': (None, ''),
+           '.s2s': (None, 'jibbigo'),
+           '.traineddata': (None, 'tessdata')}
+
+
+def synthetic_tree(folder, count, seed=0, payload=512):
+    """Write the files of a release into folder: a build.prop and about
+    count files named as in synthetic_names, the SD card in folder/card"""
+    rnd = random.Random(seed)
+    languages = sorted(luxreport.Settings.languages)
+    numbers = sorted(luxreport.Settings.languages_by_num)
+    paths = {os.path.join('system', 'build.prop')}
+    for i, name in enumerate(synthetic_names(count, seed)):
+        image, card = _PLACES.get(os.path.splitext(name)[1],
+                                  ('system/app', None))
+        if image is None or (card is not None and i % 2):
+            paths.add(os.path.join('card', card, name))
+        else:
+            paths.add(os.path.join(image, name))
+    # The folders recognized by their names, with a file in each
+    for language in rnd.sample(languages, 3):
+        paths.add(os.path.join('data', 'srec', '%s-%s' % (
+                               language, language.upper()), 'g2p.dat'))
+    for ulearn in ('data/com.ectaco.ul', 'card/com.ectaco.ul2'):
+        for _ in range(2):
+            paths.add(os.path.join(ulearn, 'DATA%02i_%02i' % tuple(
+                                   rnd.sample(numbers, 2)), 'words.dat'))
+    for path in sorted(paths):
+        filename = os.path.join(folder, path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'wb') as fp:
+            if path.endswith('build.prop'):
+                fp.write(b'ro.build.id=bench\nro.product.model=Lux %i\n' %
+                         rnd.randrange(100))
+            else:
+                fp.write(rnd.randbytes(rnd.randrange(payload + 1)))
+    return os.path.join(folder, 'card')
+
+
+def write_archive(folder, filename):
+    """Pack the contents of folder as a zip, 7z or tar.gz by the name
+
+    Returns False if there is no 7z to make a 7z archive.
+    """
+    kind = luxreport.Unpacker.kind(filename)
+    if kind == 'zip':
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for root, dirs, files in os.walk(folder):
+                for name in sorted(dirs) + sorted(files):
+                    path = os.path.join(root, name)
+                    zf.write(path, os.path.relpath(path, folder))
+    elif kind == 'tgz':
+        with tarfile.open(filename, 'w:gz') as tf:
+            for name in sorted(os.listdir(folder)):
+                tf.add(os.path.join(folder, name), name)
+    elif kind == '7z':
+        if luxreport.Unpacker._which('7z') is None:
+            return False
+        subprocess.run(['7z', 'a', '-bd', '-y', os.path.abspath(filename),
+                        '.'], cwd=folder, stdout=subprocess.DEVNULL,
+                       check=True)
+    else:
+        raise ValueError('Cannot write "%s"' % filename)
+    return True
+
+
+def synthetic_release(filename, count, seed=0):
+    """Write a release archive of about count files, its SD card nested
+    as sdcard.zip, sdcard.7z or sdcard.tar.gz of the same kind
+
+    Returns False if the archive cannot be made here.
+    """
+    card_name = {'zip': 'sdcard.zip', '7z': 'sdcard.7z',
+                 'tgz': 'sdcard.tar.gz'}[luxreport.Unpacker.kind(filename)]
+    with tempfile.TemporaryDirectory() as folder:
+        card = synthetic_tree(folder, count, seed)
+        if not write_archive(card, os.path.join(folder, card_name)):
+            return False
+        shutil.rmtree(card)
+        return write_archive(folder, filename)
+
+
+def bench_analyze(scales, kinds=('zip', '7z', 'tar.gz')):
+    """Analize a release of each kind and scale (files), listed and
+    unpacked; return [(bench, scale, seconds)]"""
+    result = []
+    with tempfile.TemporaryDirectory() as folder:
+        for kind in kinds:
+            for scale in scales:
+                filename = os.path.join(folder, 'lux2_%i.%s' % (scale, kind))
+                if not synthetic_release(filename, scale, seed=scale):
+                    logging.warning('Skip the %s releases: no archiver' %
+                                    kind)
+                    break
+                for label, listing in (('list', True), ('unpack', False)):
+                    start = time.perf_counter()
+                    luxreport.Analizer(filename, listing=listing)
+                    result.append(('analyze.%s.%s' % (kind, label), scale,
+                                   time.perf_counter() - start))
+                os.remove(filename)
+    return result
+
+
+def bench_refresh(releases, files=200, workers=1):
+    """Refresh the report of a folder of releases (zip) from scratch,
+    with nothing changed and with one release added; return
+    [(bench, scale, seconds)]"""
+    result = []
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, 'releases')
+        os.mkdir(source)
+        report = os.path.join(folder, 'report.xml')
+        for i in range(releases + 1):
+            synthetic_release(os.path.join(
+                folder if i == releases else source,
+                'lux2_%06i.zip' % i), files, seed=i)
+        for label in ('cold', 'warm', 'add'):
+            if label == 'add':
+                os.rename(os.path.join(folder, 'lux2_%06i.zip' % releases),
+                          os.path.join(source, 'lux2_%06i.zip' % releases))
+            start = time.perf_counter()
+            luxreport.ReleaseCollection(workers=workers).refresh(
+                                                        source, report)
+            result.append(('refresh.' + label, releases,
+                           time.perf_counter() - start))
+    return result
+
+
+def bench_releases(count):
+    """Construct, export and import count releases, return seconds per
+    stage"""
+    data = list(synthetic_releases(count))
+    result = {}
+    start = time.perf_counter()
+    collection = luxreport.ReleaseCollection()
+    for d in data:
+        collection[d['project_id']] = luxreport.Release(**d)
+    result['construct'] = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as folder:
+        for ext in ('.json', '.xml', '.bin', '.html', '.txt'):
+            filename = os.path.join(folder, 'bench' + ext)
+            start = time.perf_counter()
+            collection.export(filename)
+            result['export' + ext] = time.perf_counter() - start
+            if ext in ('.html', '.txt'):
+                continue
+            start = time.perf_counter()
+            luxreport.ReleaseCollection().import_(filename)
+            result['import' + ext] = time.perf_counter() - start
+    return result
+
+
+def _baseline_text(collection, fp):
+    """export_text as it was: a wrap and a write per release"""
+    wrapper = textwrap.TextWrapper(initial_indent="    ",
+                                   subsequent_indent="    ")
+    for release in collection.values():
+        fp.write(luxreport.ReleaseCollection._TEXT.format(
+                 release, dash_name='=' * len(release.project_id),
+                 apps_ectaco='\n'.join(wrapper.wrap(release.apps_ectaco)),
+                 apps_other='\n'.join(wrapper.wrap(release.apps_other))))
+
+
+def bench_text(count):
+    """Write the text report of count releases the old and the new way,
+    return seconds of each"""
+    collection = luxreport.ReleaseCollection()
+    for d in synthetic_releases(count):
+        collection[d['project_id']] = luxreport.Release(**d)
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        old, new = (os.path.join(folder, n) for n in ('old.txt', 'new.txt'))
+        start = time.perf_counter()
+        with open(old, 'w', encoding='utf8') as fp:
+            _baseline_text(collection, fp)
+        result['baseline'] = time.perf_counter() - start
+        start = time.perf_counter()
+        collection.export_text(new)
+        result['streaming'] = time.perf_counter() - start
+        with open(old, 'rb') as a, open(new, 'rb') as b:
+            assert a.read() == b.read(), 'the text reports differ'
+    return result
+
+
+def bench_pages(count, pages=100):
+    """Export count releases to the paged HTML report incrementally: after
+    a release is analyzed again and with nothing changed; check the pages
+    against a full export, return seconds of each"""
+    collection = luxreport.ReleaseCollection(incremental=True)
+    for d in synthetic_releases(count):
+        collection[d['project_id']] = luxreport.Release(**d)
+    project_id = next(collection.keys())
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        report = os.path.join(folder, 'report.xml')
+        # The fragments of the single page report are reused by the pages.
+        collection.export(report, complete=True)
+        collection.pages = pages
+        for label in ('changed', 'unchanged'):
+            if label == 'changed':
+                data = collection[project_id].as_dict()
+                data['project_model'] = 'Lux changed'
+                collection[project_id] = luxreport.Release(**data)
+                collection.dirty.add(project_id)
+            start = time.perf_counter()
+            collection.export(report, complete=True)
+            result[label] = time.perf_counter() - start
+            with open(os.path.join(folder, 'report_page_1.html'),
+                      encoding='utf8') as fp:
+                assert 'Lux changed' in fp.read(), 'the page is out of date'
+        full = luxreport.ReleaseCollection(pages=pages)
+        for key, release in collection.items():
+            full[key] = release
+        os.mkdir(os.path.join(folder, 'full'))
+        full.export(os.path.join(folder, 'full', 'report.xml'),
+                    complete=True)
+        for name in os.listdir(os.path.join(folder, 'full')):
+            if name.startswith('report_page_'):
+                with open(os.path.join(folder, name), 'rb') as a, \
+                        open(os.path.join(folder, 'full', name), 'rb') as b:
+                    assert a.read() == b.read(), 'the pages differ'
+    return result
+
+
+def bench_classify(count, folder_size=100):
+    """Classify count synthetic file names, return names per second"""
+    names = list(synthetic_names(count))
+    folders = [names[i:i + folder_size]
+               for i in range(0, len(names), folder_size)]
+    analizer = luxreport.Analizer.__new__(luxreport.Analizer)
+    for f in luxreport.Analizer._FACETS:
+        setattr(analizer, f, set())
+    luxreport.Analizer._facets_of.cache_clear()
+    result = {}
+    for label in ('cold', 'warm'):
+        start = time.perf_counter()
+        for i, files in enumerate(folders):
+            analizer._classify('', [], files, card=bool(i % 2))
+        elapsed = time.perf_counter() - start
+        result[label] = count / elapsed
+    return result
+
+
+def _version():
+    """The git revision of luxreport, if it is in a work tree"""
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(
+                os.path.abspath(luxreport.__file__)), check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def save(results, filename):
+    """Write the results with the version and the machine as JSON"""
+    with open(filename, 'w', encoding='utf8') as fp:
+        json.dump({'version': _version(),
+                   'date': datetime.datetime.now().isoformat(
+                                                    timespec='seconds'),
+                   'python': platform.python_version(),
+                   'machine': platform.platform(),
+                   'cpus': os.cpu_count(),
+                   'results': [{'bench': b, 'scale': n, 'value': v, 'unit': u}
+                               for b, n, v, u in results]},
+                  fp, indent=1)
+
+
+def compare(results, filename):
+    """Print the results next to the ones saved in filename"""
+    with open(filename, 'r', encoding='utf8') as fp:
+        old = json.load(fp)
+    values = {(r['bench'], r['scale']): r['value'] for r in old['results']}
+    print('compared with %s of %s' % (old['version'] or '?', old['date']))
+    for bench, scale, value, unit in results:
+        before = values.get((bench, scale))
+        if not before or not value:
+            continue
+        # Higher is better for rates, lower for times.
+        ratio = before / value if unit == 's' else value / before
+        print('%-28s %8s %12.3f %12.3f %6.2fx' % (
+              bench, scale, before, value, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--names', type=int, default=1000000,
+                        help='number of synthetic file names')
+    parser.add_argument('-r', '--releases', type=int, default=100000,
+                        help='number of synthetic releases')
+    parser.add_argument('-t', '--text', type=int, default=50000,
+                        help='number of releases in the text report')
+    parser.add_argument('-p', '--pages', type=int, default=10000,
+                        help='number of releases in the paged HTML report')
+    parser.add_argument('-s', '--suite', action='store_true',
+                        help='time the pipeline on synthetic archives '
+                             'instead')
+    parser.add_argument('--scales', default='100,1000,10000',
+                        help='files per release of the suite, the '
+                             'releases in a folder are a tenth of them')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='processes of the suite refresh')
+    parser.add_argument('-o', '--output',
+                        help='save the results to a JSON file')
+    parser.add_argument('-c', '--compare',
+                        help='compare with the results in a JSON file')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # (bench, scale, value, unit)
+    results = []
+    if args.suite:
+        try:
+            scales = [int(x) for x in args.scales.split(',')]
+        except ValueError:
+            parser.error('--scales takes numbers like 100,1000')
+        results += [r + ('s',) for r in bench_analyze(scales)]
+        for scale in scales:
+            results += [r + ('s',) for r in bench_refresh(
+                            max(1, scale // 10), workers=args.workers)]
+            seconds = bench_releases(scale)
+            results += [('releases.' + k, scale, v, 's')
+                        for k, v in sorted(seconds.items())]
+    else:
+        if args.names:
+            rates = bench_classify(args.names)
+            results += [('classify.' + k, args.names, v, 'names/s')
+                        for k, v in sorted(rates.items())]
+        if args.releases:
+            seconds = bench_releases(args.releases)
+            results += [('releases.' + k, args.releases, v, 's')
+                        for k, v in sorted(seconds.items())]
+        if args.text:
+            seconds = bench_text(args.text)
+            results += [('text.' + k, args.text, v, 's')
+                        for k, v in sorted(seconds.items())]
+        if args.pages:
+            seconds = bench_pages(args.pages)
+            results += [('pages.' + k, args.pages, v, 's')
+                        for k, v in sorted(seconds.items())]
+    for bench, scale, value, unit in results:
+        print('%-28s %8s %12.3f %s' % (bench, scale, value, unit))
+    if args.output:
+        save(results, args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -16,22 +16,38 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import argparse
+import array
 import collections
+import concurrent.futures
 import copy
+import contextlib
+import hashlib
+import io
+import itertools
 import json
 import logging
+import mmap
+import multiprocessing
 import os
 import sys
 import os.path
 import re
+import select
 import shutil
+import signal
+import stat
+import struct
+import subprocess
+import tarfile
 import tempfile
 import textwrap
-import xml.dom.minidom
+import time
 import xml.etree.ElementTree
 import xml.sax.saxutils
+import zipfile
 
-from functools import wraps
+from functools import lru_cache
 
 
 # It's logger and I've use it instead of print.
@@ -100,6 +116,194 @@ class Settings(object):
         {"iw": languages["he"], "jp": languages["ja"],
          "ua": languages["uk"], "us": languages["en"]})
     languages_by_num = {v[1]: v[0] for v in languages.values()}
+    languages_by_iso639_2 = {v[2]: v[0] for v in languages.values()}
+    # The folder for the temp files, a tmpfs for the archives which fit it
+    # and the GB all the parallel analyses may take there (0 is no limit).
+    scratch = {'disk': '/shares/releases/xml', 'tmpfs': '', 'budget_gb': 0}
+    if os.access(os.path.join(home, 'luxreport_scratch.json'), os.F_OK):
+        with open(os.path.join(home, 'luxreport_scratch.json')) as fp:
+            scratch.update(json.load(fp))
+
+
+class Metrics(object):
+    """Wall time, bytes, files and temp disk usage of the pipeline stages
+
+    Every stage appends a record {archive, stage, time, seconds, bytes,
+    files}. The stages nest (a scan contains the extractions it needs), so
+    their seconds are inclusive. With walk the temp folders are walked
+    too: the unpack records get the bytes and files unpacked, and the
+    "analyze" record of an archive the peak usage of the temp folders in
+    temp_peak. The walks cost as much as the scan, they are off by default.
+    """
+    def __init__(self, walk=False):
+        self.records = []
+        self.archive = ''
+        self.walk = walk
+        self.temp_peak = 0
+        self._temp = []
+        self._saved = 0
+
+
+    @contextlib.contextmanager
+    def stage(self, name, archive=None, start=None):
+        """Time the block, the caller may fill in bytes and files
+
+        The start is a time.perf_counter() value if the stage began before
+        the block.
+        """
+        outer = self.archive
+        if archive is not None:
+            self.archive = archive
+        record = {'archive': self.archive, 'stage': name,
+                  'time': round(time.time(), 3), 'seconds': 0.0,
+                  'bytes': 0, 'files': 0}
+        if start is None:
+            start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            self.records.append(record)
+            self.archive = outer
+
+
+    @staticmethod
+    def usage(path):
+        """(bytes, files) under the path, mount points are not entered"""
+        size, files = 0, 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not os.path.ismount(entry.path):
+                            s, f = Metrics.usage(entry.path)
+                            size, files = size + s, files + f
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+        except OSError:
+            pass
+        return size, files
+
+
+    def enter_temp(self, path):
+        if self.walk:
+            self._temp.append(path)
+
+
+    def exit_temp(self, path):
+        """Update the peak with the usage of all the live temp folders"""
+        if not self.walk:
+            return
+        tops = [p for p in self._temp if not any(
+                p.startswith(q + os.sep) for q in self._temp)]
+        self.temp_peak = max(self.temp_peak,
+                             sum(Metrics.usage(p)[0] for p in tops))
+        self._temp.remove(path)
+
+
+    def save(self, filename):
+        """Append the records not saved yet to the JSON-lines file"""
+        try:
+            with open(filename, mode='a', encoding='utf-8') as fp:
+                for record in self.records[self._saved:]:
+                    fp.write(json.dumps(record, sort_keys=True) + '\n')
+            self._saved = len(self.records)
+        except OSError as err:
+            logger.error(err)
+
+
+    def clear(self):
+        del self.records[:]
+        self._saved = 0
+
+
+    def summary(self):
+        """The table of the records summed up by stage"""
+        total = collections.OrderedDict()
+        for r in self.records:
+            row = total.setdefault(r['stage'], [0, 0.0, 0, 0, 0])
+            row[0] += 1
+            row[1] += r['seconds']
+            row[2] += r['bytes']
+            row[3] += r['files']
+            row[4] = max(row[4], r.get('temp_peak', 0))
+        lines = ['%-14s %6s %10s %14s %10s %14s' % (
+                 'stage', 'count', 'seconds', 'bytes', 'files', 'temp peak')]
+        for name, row in total.items():
+            lines.append('%-14s %6i %10.2f %14i %10i %14i' % (
+                         (name,) + tuple(row)))
+        return '\n'.join(lines)
+
+
+METRICS = Metrics()
+
+
+class Scratch(object):
+    """The place of the temp folders and the budget of their size
+
+    An analysis reserves the bytes it is going to extract. They go to the
+    tmpfs if it is set and has room for them, otherwise to the disk. The
+    budget is shared by the pool workers: a reservation waits while it
+    would exceed the budget, unless nothing else is reserved.
+    """
+    def __init__(self, disk, tmpfs='', budget=0):
+        self.disk = disk
+        self.tmpfs = tmpfs
+        self.budget = budget
+        self.folder = disk
+        self._lock = multiprocessing.Condition()
+        self._used = multiprocessing.RawValue('q', 0)
+        self._tmpfs_used = multiprocessing.RawValue('q', 0)
+
+
+    def _fits_tmpfs(self, size):
+        if not self.tmpfs:
+            return False
+        try:
+            free = shutil.disk_usage(self.tmpfs).free
+        except OSError as err:
+            logger.error(err)
+            return False
+        # The others may not have written all they reserved yet.
+        return size <= free - self._tmpfs_used.value
+
+
+    @contextlib.contextmanager
+    def reserve(self, size):
+        """Wait for size bytes of the budget, yield the folder for them"""
+        start = time.perf_counter()
+        waited = False
+        with self._lock:
+            while (self.budget and self._used.value and
+                   self._used.value + size > self.budget):
+                if not waited:
+                    logger.info('Wait for %.2f GB of scratch space' %
+                                (1e-9 * size))
+                    waited = True
+                self._lock.wait()
+            self._used.value += size
+            on_tmpfs = self._fits_tmpfs(size)
+            if on_tmpfs:
+                self._tmpfs_used.value += size
+        if waited:
+            with METRICS.stage('wait', start=start) as record:
+                record['bytes'] = size
+        outer = self.folder
+        self.folder = self.tmpfs if on_tmpfs else self.disk
+        try:
+            yield self.folder
+        finally:
+            self.folder = outer
+            with self._lock:
+                self._used.value -= size
+                if on_tmpfs:
+                    self._tmpfs_used.value -= size
+                self._lock.notify_all()
+
+
+SCRATCH = Scratch(Settings.scratch['disk'], Settings.scratch['tmpfs'],
+                  int(1e9 * Settings.scratch['budget_gb']))
 
 
 class AbstractDir(object):
@@ -138,16 +342,19 @@ class AbstractDir(object):
 
 
 class TempDir(AbstractDir):
-    def __init__(self, name='/shares/releases/xml'):
-        super().__init__(name)
+    def __init__(self, name=None):
+        """A folder in name, in the scratch folder by default"""
+        super().__init__(name or SCRATCH.folder)
 
 
     def __enter__(self):
+        METRICS.enter_temp(self.name)
         return self.name
 
 
     # noinspection PyUnusedLocal
     def __exit__(self, *ignore):
+        METRICS.exit_temp(self._name)
         super().remove()
 
 
@@ -160,303 +367,726 @@ class ExtDir(AbstractDir):
 
 
     def __enter__(self):
-        os.system('/usr/local/etc/rc.d/fusefs onestart && ext4fuse %s %s' % 
-                  (self._filename, self._name))
+        with METRICS.stage('mount') as record:
+            os.system('/usr/local/etc/rc.d/fusefs onestart && ext4fuse %s %s'
+                      % (self._filename, self._name))
+            record['bytes'] = os.path.getsize(self._filename)
         os.system('ls -m %s' % self._name)
         return self.name
 
 
     def __exit__(self, *ignore):
-        command = 'sync && '
-        command += ' || '.join(['/usr/local/etc/rc.d/fusefs {0}'.format(s)
-                            for s in ('onestop', 'faststop', 'forcestop')])
-        os.system(command)
+        # Unmount only our own mount point: stopping the fusefs service would
+        # pull the images out from under the other workers.
+        with METRICS.stage('unmount'):
+            os.system('sync && umount {0} || umount -f {0}'.format(
+                                                                self._name))
         super().remove()
 
 
-def stripper(method):
-    @wraps(method)
-    def wrapper(self, s):
-        r = str(s).strip() if s else "-"
-        return method(self, r)
-    return wrapper
-
+# noinspection PyCompatibility
+class Unpacker(object):
+    """Unpack an archive into a folder by the archivers in child processes
 
-class Release(object):
-    def __init__(self, project_id, project_model="", apps_ectaco="",
-                 apps_other="", voice_dictionary="", voice_phrasebook="",
-                 photo_text="", ulearn='', ulearn2='', feature_tts="",
-                 feature_sr="", feature_gt="", feature_jibbigo="",
-                 sd_size=""):
-        self.__project_id = str(project_id).strip()
-        self.project_model = project_model
-        self.apps_ectaco = apps_ectaco
-        self.apps_other = apps_other
-        self.voice_dictionary = voice_dictionary
-        self.voice_phrasebook = voice_phrasebook
-        self.photo_text = photo_text
-        self.ulearn = ulearn
-        self.ulearn2 = ulearn2
-        self.feature_tts = feature_tts
-        self.feature_sr = feature_sr
-        self.feature_gt = feature_gt
-        self.feature_jibbigo = feature_jibbigo
-        self.sd_size = sd_size
-
-        self.__facet = ['project_id', 'project_model', 'apps_ectaco',
-                        'apps_other', 'voice_dictionary', 'voice_phrasebook',
-                        'photo_text', 'ulearn', 'ulearn2', 'feature_tts',
-                        'feature_sr', 'feature_gt', 'feature_jibbigo',
-                        'sd_size']
+    There is no shell and no chdir, every child runs in the folder, so
+    several archives may be unpacked at the same time: start() them all,
+    then wait() for each. The multi-threaded decoders are used if they are
+    installed.
+    """
+    # The exit codes of the archivers which are only warnings.
+    _WARNINGS = {'7z': (1,), 'unzip': (1,)}
+    _DECODERS = {'tgz': ('pigz', 'gzip'), 'tzst': ('zstd',)}
 
 
-    @property
-    def facet(self):
-        """The list of the class members"""
-        return copy.deepcopy(self.__facet)
+    def __init__(self, src, dst):
+        assert os.access(src, os.F_OK), 'file not found'
+        assert os.path.isdir(dst), 'invalid directory'
+        self.src = os.path.abspath(src)
+        self.dst = dst
+        self.kind = Unpacker.kind(src)
+        self._children = []
+        self._start = None
 
 
-    @property
-    def project_id(self):
-        """The file name"""
-        return self.__project_id
+    @staticmethod
+    def kind(filename):
+        """7z, zip, tgz or tzst by the file name"""
+        name = filename.lower()
+        if name.endswith(('.7z', '.exe')):
+            return '7z'
+        elif name.endswith('.zip'):
+            return 'zip'
+        elif name.endswith(('.tar.gz', '.tgz')):
+            return 'tgz'
+        elif name.endswith(('.tar.zst', '.tzst')):
+            return 'tzst'
+        raise ValueError('"%s" is not a format. Known formats are EXE, 7Z, '
+                         'ZIP, TAR.GZ, and TAR.ZST.' %
+                         os.path.basename(filename))
 
 
-    @property
-    def project_model(self):
-        """The languages presented in project"""
-        return self.__project_model
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _which(*names):
+        """The first of the programs found in PATH"""
+        for name in names:
+            if shutil.which(name):
+                return name
+        return None
+
+
+    def commands(self):
+        """The argument lists of the pipeline"""
+        if self.kind == '7z':
+            return [['7z', 'x', '-y', '-bd', '-mmt=on', '-o' + self.dst,
+                     self.src]]
+        elif self.kind == 'zip':
+            return [['unzip', '-qq', '-o', self.src, '-d', self.dst]]
+        decoder = Unpacker._which(*Unpacker._DECODERS[self.kind])
+        if decoder is None:
+            # tar recognizes the compression by itself
+            return [['tar', '-xf', self.src]]
+        threads = {'pigz': ['-p', str(os.cpu_count() or 1)],
+                   'zstd': ['-T0']}
+        return [[decoder, '-dc'] + threads.get(decoder, []) + [self.src],
+                ['tar', '-xf', '-']]
+
+
+    def start(self):
+        """Run the archivers and return at once"""
+        assert not self._children, 'already started'
+        self._start = time.perf_counter()
+        commands = self.commands()
+        stdin = subprocess.DEVNULL
+        try:
+            for i, args in enumerate(commands):
+                # A file, not a pipe: a chatty child cannot block on it
+                # while we wait for another one.
+                stderr = tempfile.TemporaryFile()
+                try:
+                    child = subprocess.Popen(
+                        args, cwd=self.dst, stdin=stdin, stderr=stderr,
+                        stdout=(subprocess.DEVNULL if i == len(commands) - 1
+                                else subprocess.PIPE))
+                except OSError:
+                    stderr.close()
+                    raise
+                self._children.append((child, stderr))
+                if stdin is not subprocess.DEVNULL:
+                    stdin.close()
+                stdin = child.stdout
+        except OSError:
+            self._kill()
+            raise
+        return self
+
+
+    def wait(self):
+        """Wait for the archivers, raise CalledProcessError if one failed"""
+        errors = []
+        with METRICS.stage('unpack.' + self.kind,
+                           start=self._start) as record:
+            for child, stderr in self._children:
+                code = child.wait()
+                stderr.seek(0)
+                message = stderr.read().decode(errors='replace').strip()
+                stderr.close()
+                program = os.path.basename(child.args[0])
+                if code in Unpacker._WARNINGS.get(program, ()):
+                    logger.warning('%s: %s' % (program, message))
+                elif code:
+                    errors.append(subprocess.CalledProcessError(
+                                        code, child.args, stderr=message))
+            self._children = []
+            if METRICS.walk:
+                record['bytes'], record['files'] = Metrics.usage(self.dst)
+        if errors:
+            raise errors[0]
+
+
+    def _kill(self):
+        for child, stderr in self._children:
+            child.kill()
+            child.wait()
+            stderr.close()
+        self._children = []
+
+
+class Ext4Image(object):
+    """Read-only ext2/3/4 image: the folder tree and the file contents
+
+    It reads the memory-mapped image itself, so there is nothing to mount.
+    """
+    _MAGIC = 0xEF53
+    _ROOT = 2
+    _INCOMPAT_FILETYPE = 0x2
+    _INCOMPAT_META_BG = 0x10
+    _INCOMPAT_64BIT = 0x80
+    _INCOMPAT_INLINE_DATA = 0x8000
+    _EXTENTS_FL = 0x80000
+    _EXTENT_MAGIC = 0xF30A
+    _FT_DIR = 2
 
-    # noinspection PyAttributeOutsideInit
-    @project_model.setter
-    @stripper
-    def project_model(self, s):
-        self.__project_model = s
 
+    def __init__(self, filename):
+        self._filename = filename
+        self._entries = {}
+        with open(filename, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_superblock()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+
+    def _read_superblock(self):
+        sb = 1024
+        if struct.unpack_from('<H', self._map, sb + 0x38)[0] != self._MAGIC:
+            raise ValueError('"%s" is not ext2/3/4' % self._filename)
+        (first_data_block, log_block_size) = struct.unpack_from(
+                                                '<II', self._map, sb + 0x14)
+        self._inodes_per_group = struct.unpack_from(
+                                                '<I', self._map, sb + 0x28)[0]
+        rev_level = struct.unpack_from('<I', self._map, sb + 0x4C)[0]
+        self._inode_size = (struct.unpack_from('<H', self._map, sb + 0x58)[0]
+                            if rev_level else 128)
+        self._incompat = struct.unpack_from('<I', self._map, sb + 0x60)[0]
+        if self._incompat & (self._INCOMPAT_META_BG |
+                             self._INCOMPAT_INLINE_DATA):
+            raise ValueError('"%s" uses unsupported features' %
+                             self._filename)
+        self._desc_size = 32
+        if self._incompat & self._INCOMPAT_64BIT:
+            self._desc_size = struct.unpack_from('<H', self._map,
+                                                 sb + 0xFE)[0] or 32
+        self._block_size = 1024 << log_block_size
+        self._gdt = (first_data_block + 1) * self._block_size
 
-    @property
-    def apps_ectaco(self):
-        """The apps from Ectaco"""
-        return self.__apps_ectaco
 
+    def __enter__(self):
+        return self
 
-    # noinspection PyAttributeOutsideInit
-    @apps_ectaco.setter
-    @stripper
-    def apps_ectaco(self, s):
-        self.__apps_ectaco = s
 
+    def __exit__(self, *ignore):
+        self.close()
+
+
+    def close(self):
+        self._map.close()
+
+
+    def _block(self, number, count=1):
+        start = number * self._block_size
+        end = start + count * self._block_size
+        if end > len(self._map):
+            raise ValueError('"%s" is truncated' % self._filename)
+        return self._map[start:end]
+
+
+    def _inode(self, number):
+        """(mode, size, flags, i_block) of the inode"""
+        group, index = divmod(number - 1, self._inodes_per_group)
+        desc = self._gdt + group * self._desc_size
+        table = struct.unpack_from('<I', self._map, desc + 0x8)[0]
+        if self._desc_size >= 64:
+            table |= struct.unpack_from('<I', self._map, desc + 0x28)[0] << 32
+        offset = table * self._block_size + index * self._inode_size
+        mode, size = struct.unpack_from('<HxxI', self._map, offset)
+        flags = struct.unpack_from('<I', self._map, offset + 0x20)[0]
+        size |= struct.unpack_from('<I', self._map, offset + 0x6C)[0] << 32
+        return mode, size, flags, self._map[offset + 0x28:offset + 0x64]
+
+
+    def _extents(self, node):
+        """Yield (logical, physical, count, initialized) of an extent tree"""
+        magic, entries, _, depth = struct.unpack_from('<HHHH', node)
+        if magic != self._EXTENT_MAGIC:
+            raise ValueError('"%s" has a broken extent' % self._filename)
+        for i in range(entries):
+            offset = 12 + 12 * i
+            if depth:
+                leaf_lo, leaf_hi = struct.unpack_from('<xxxxIH', node, offset)
+                yield from self._extents(
+                                    self._block((leaf_hi << 32) | leaf_lo))
+            else:
+                logical, count, start_hi, start_lo = struct.unpack_from(
+                                                        '<IHHI', node, offset)
+                initialized = count <= 32768
+                if not initialized:
+                    count -= 32768
+                yield logical, (start_hi << 32) | start_lo, count, initialized
+
+
+    def _block_map(self, i_block, blocks):
+        """Yield (logical, physical, 1, True) of an ext2/3 block map"""
+        per_block = self._block_size // 4
+
+        def walk(number, level):
+            if not number:
+                # A hole: no blocks are allocated for the whole subtree.
+                yield from itertools.repeat(0, per_block ** level)
+                return
+            if not level:
+                yield number
+                return
+            for n in struct.unpack_from('<%iI' % per_block,
+                                        self._block(number)):
+                yield from walk(n, level - 1)
+
+        pointers = struct.unpack_from('<15I', i_block)
+        numbers = itertools.chain(pointers[:12], *(
+            walk(top, level) for level, top in enumerate(pointers[12:], 1)))
+        for logical, n in zip(range(blocks), numbers):
+            if n:
+                yield logical, n, 1, True
+
+
+    def _chunks(self, number):
+        """Yield the contents of the inode block by block"""
+        mode, size, flags, i_block = self._inode(number)
+        if stat.S_ISLNK(mode) and size < 60:
+            yield i_block[:size]
+            return
+        blocks = -(-size // self._block_size)
+        if flags & self._EXTENTS_FL:
+            runs = sorted(self._extents(i_block))
+        else:
+            runs = self._block_map(i_block, blocks)
+        position = 0
+        for logical, physical, count, initialized in runs:
+            count = min(count, blocks - logical)
+            if count <= 0:
+                break
+            hole = logical * self._block_size - position
+            if hole > 0:
+                yield bytes(hole)
+            length = min(count * self._block_size,
+                         size - logical * self._block_size)
+            if initialized:
+                yield self._block(physical, count)[:length]
+            else:
+                yield bytes(length)
+            position = logical * self._block_size + length
+        if position < size:
+            yield bytes(size - position)
+
+
+    def _listdir(self, number):
+        """The {name: (inode, is_dir)} of the folder inode"""
+        if number in self._entries:
+            return self._entries[number]
+        result = {}
+        data = b''.join(self._chunks(number))
+        offset = 0
+        while offset + 8 <= len(data):
+            inode, rec_len, name_len, file_type = struct.unpack_from(
+                                                        '<IHBB', data, offset)
+            if not self._incompat & self._INCOMPAT_FILETYPE:
+                name_len |= file_type << 8
+                file_type = 0
+            if rec_len < 8:
+                break
+            if inode:
+                name = data[offset + 8:offset + 8 + name_len].decode(
+                                                'utf8', 'surrogateescape')
+                if name not in ('.', '..'):
+                    if file_type:
+                        is_dir = file_type == self._FT_DIR
+                    else:
+                        is_dir = stat.S_ISDIR(self._inode(inode)[0])
+                    result[name] = (inode, is_dir)
+            offset += rec_len
+        self._entries[number] = result
+        return result
 
-    @property
-    def apps_other(self):
-        """The apps from all other"""
-        return self.__apps_other
 
-    # noinspection PyAttributeOutsideInit
-    @apps_other.setter
-    @stripper
-    def apps_other(self, s):
-        self.__apps_other = s
+    def _lookup(self, path):
+        number = self._ROOT
+        for name in (i for i in path.split('/') if i):
+            number = self._listdir(number)[name][0]
+        return number
 
 
-    @property
-    def voice_dictionary(self):
-        """The languages with true voice for the Dictionary"""
-        return self.__voice_dictionary
+    def listdir(self, path):
+        return sorted(self._listdir(self._lookup(path)))
 
-    # noinspection PyAttributeOutsideInit
-    @voice_dictionary.setter
-    @stripper
-    def voice_dictionary(self, s):
-        self.__voice_dictionary = s
 
+    def walk(self, top=''):
+        """The same as os.walk over the mounted image"""
+        dirs, files = [], []
+        for name, (inode, is_dir) in sorted(
+                                    self._listdir(self._lookup(top)).items()):
+            (dirs if is_dir else files).append(name)
+        yield top, dirs, files
+        for d in dirs:
+            yield from self.walk(os.path.join(top, d))
 
-    @property
-    def voice_phrasebook(self):
-        """The languages with true voice for the PhraseBook"""
-        return self.__voice_phrasebook
 
-    # noinspection PyAttributeOutsideInit
-    @voice_phrasebook.setter
-    @stripper
-    def voice_phrasebook(self, s):
-        self.__voice_phrasebook = s
+    def read(self, path):
+        return b''.join(self._chunks(self._lookup(path)))
 
 
-    @property
-    def photo_text(self):
-        """The languages for Photo Text / Input app"""
-        return self.__photo_text
+    def extract(self, path, dst):
+        """Copy the file out of the image and return its path"""
+        name = os.path.join(dst, path)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with METRICS.stage('extract') as record, open(name, 'wb') as fp:
+            for chunk in self._chunks(self._lookup(path)):
+                fp.write(chunk)
+                record['bytes'] += len(chunk)
+            record['files'] = 1
+        return name
 
-    # noinspection PyAttributeOutsideInit
-    @photo_text.setter
-    @stripper
-    def photo_text(self, s):
-        self.__photo_text = s
 
+class ArchiveListing(object):
+    """The tree of archive members built from the archive header only
 
-    @property
-    def ulearn(self):
-        """The language pair for ULearn app"""
-        return self.__ulearn
+    An archive inside another one (an SD card archive in a release) has
+    the listing of the outer archive as parent. Its members are read right
+    out of the outer archive, it is never extracted as a whole.
+    """
+    def __init__(self, filename, members, parent=None):
+        """members are (name, size, is_dir) tuples
 
-    # noinspection PyAttributeOutsideInit
-    @ulearn.setter
-    @stripper
-    def ulearn(self, s):
-        self.__ulearn = s
+        The filename is a member of the parent if the parent is given.
+        """
+        self._filename = filename
+        self._parent = parent
+        self.kind = Unpacker.kind(filename)
+        self._dirs = collections.defaultdict(set)
+        self._files = collections.defaultdict(dict)
+        self._members = {}
+        for name, size, is_dir in members:
+            parts = [i for i in name.replace('\\', '/').split('/')
+                     if i not in ('', '.', '..')]
+            if not parts:
+                continue
+            for i in range(len(parts) - 1):
+                self._dirs['/'.join(parts[:i])].add(parts[i])
+            root, leaf = '/'.join(parts[:-1]), parts[-1]
+            if is_dir:
+                self._dirs[root].add(leaf)
+            else:
+                self._files[root][leaf] = size
+                self._members['/'.join(parts)] = name
 
 
     @property
-    def ulearn2(self):
-        """The language pair for ULearn-2 app"""
-        return self.__ulearn2
+    def size(self):
+        """The uncompressed size of all members in bytes"""
+        return sum(sum(f.values()) for f in self._files.values())
 
-    # noinspection PyAttributeOutsideInit
-    @ulearn2.setter
-    @stripper
-    def ulearn2(self, s):
-        self.__ulearn2 = s
 
+    def __len__(self):
+        """The number of files"""
+        return len(self._members)
 
-    @property
-    def feature_tts(self):
-        """The languages for conversion text to speech"""
-        return self.__feature_tts
 
-    # noinspection PyAttributeOutsideInit
-    @feature_tts.setter
-    @stripper
-    def feature_tts(self, s):
-        self.__feature_tts = s
+    def getsize(self, path):
+        root, leaf = os.path.split(path)
+        return self._files[root][leaf]
+
+
+    def sizes(self):
+        """{top folder: bytes}, the files at the top are in "." """
+        result = collections.Counter()
+        for root, files in self._files.items():
+            result[Analizer._top_folder(root)] += sum(files.values())
+        return result
 
 
     @property
-    def feature_sr(self):
-        """The Voice Typing by Google"""
-        return self.__feature_sr
+    def streams(self):
+        """True if the members can be read without an archiver"""
+        return self.kind in ('zip', 'tgz') and (
+                    self._parent is None or self._parent.streams)
+
+
+    def _open(self):
+        if self._parent is None:
+            return open(self._filename, 'rb')
+        return self._parent.open(self._filename)
+
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """The member as a binary file object, ZIP and TAR.GZ only"""
+        member = self._members[path]
+        with self._open() as fp:
+            if self.kind == 'zip':
+                with zipfile.ZipFile(fp) as archive, \
+                        archive.open(member) as result:
+                    yield result
+            elif self.kind == 'tgz':
+                with tarfile.open(fileobj=fp, mode='r:gz') as archive:
+                    # Stop at the member, getmember() would read the rest.
+                    for info in archive:
+                        if info.name == member:
+                            yield archive.extractfile(info)
+                            break
+                    else:
+                        raise KeyError('"%s" not found' % member)
+            else:
+                raise ValueError('Cannot read "%s" from "%s"' % (
+                                  member, os.path.basename(self._filename)))
 
-    # noinspection PyAttributeOutsideInit
-    @feature_sr.setter
-    @stripper
-    def feature_sr(self, s):
-        self.__feature_sr = s
 
+    def extract(self, path, dst):
+        """Extract the member and return its path"""
+        if not self.streams:
+            return Analizer._extract_member(self._filename,
+                                            self._members[path], dst)
+        name = os.path.join(dst, path)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with METRICS.stage('extract') as record:
+            with self.open(path) as src, open(name, 'wb') as fp:
+                shutil.copyfileobj(src, fp, 1 << 20)
+            record['bytes'] = os.path.getsize(name)
+            record['files'] = 1
+        return name
 
-    @property
-    def feature_gt(self):
-        """Data for Google Translate (Internal)"""
-        return self.__feature_gt
 
-    # noinspection PyAttributeOutsideInit
-    @feature_gt.setter
-    @stripper
-    def feature_gt(self, s):
-        self.__feature_gt = s
+    def listdir(self, path):
+        return sorted(self._dirs.get(path, set()) |
+                      set(self._files.get(path, {})))
 
 
-    @property
-    def feature_jibbigo(self):
-        """The languages for Jibbigo translator"""
-        return self.__feature_jibbigo
+    def walk(self, top=''):
+        """The same as os.walk over the extracted archive"""
+        dirs = sorted(self._dirs.get(top, ()))
+        yield top, dirs, sorted(self._files.get(top, {}))
+        for d in dirs:
+            yield from self.walk(os.path.join(top, d))
+
 
-    # noinspection PyAttributeOutsideInit
-    @feature_jibbigo.setter
-    @stripper
-    def feature_jibbigo(self, s):
-        self.__feature_jibbigo = s
+class Release(object):
+    """One release image, the fields are given by Release.SCHEMA
+
+    The values are stripped strings, an empty value is "-".
+    """
+    # (field, place in the XML report): an attribute of <release>, a child
+    # element of <release> or of <features>, an attribute of <sdcard>.
+    SCHEMA = (('project_id', 'release'),         # The file name
+              ('project_model', 'release'),      # ro.product.model
+              ('apps_ectaco', 'element'),        # The apps from Ectaco
+              ('apps_other', 'element'),         # The apps from all other
+              ('voice_dictionary', 'element'),   # True voice, Dictionary
+              ('voice_phrasebook', 'element'),   # True voice, PhraseBook
+              ('photo_text', 'element'),         # Photo Text / Input langs
+              ('ulearn', 'element'),             # ULearn language pairs
+              ('ulearn2', 'element'),            # ULearn-2 language pairs
+              ('feature_tts', 'features'),       # Text to speech (SVOX)
+              ('feature_sr', 'features'),        # Voice Typing by Google
+              ('feature_gt', 'features'),        # Google Translate data
+              ('feature_jibbigo', 'features'),   # Jibbigo translator
+              ('sd_size', 'sdcard'),             # The size of SD card data
+              ('sd_folders', 'sdcard'))          # The size of its folders
+    FIELDS = tuple(f for f, _ in SCHEMA)
+    __slots__ = FIELDS
+
+
+    def __init__(self, *args, **kwargs):
+        if args:
+            if len(args) > len(Release.FIELDS):
+                raise TypeError('Release takes at most %i arguments' %
+                                len(Release.FIELDS))
+            for name, value in zip(Release.FIELDS, args):
+                if name in kwargs:
+                    raise TypeError('Release got multiple values for %r' %
+                                    name)
+                kwargs[name] = value
+        if 'project_id' not in kwargs:
+            raise TypeError('Release needs a project_id')
+        self.project_id = str(kwargs.pop('project_id')).strip()
+        for name in Release.FIELDS[1:]:
+            value = kwargs.pop(name, None)
+            setattr(self, name, str(value).strip() if value else '-')
+        if kwargs:
+            raise TypeError('Release got unexpected arguments %s' %
+                            ', '.join(sorted(kwargs)))
 
 
     @property
-    def sd_size(self):
-        """The size of data of SD card"""
-        return self.__sd_size
+    def facet(self):
+        """The names of the fields"""
+        return Release.FIELDS
+
 
-    # noinspection PyAttributeOutsideInit
-    @sd_size.setter
-    @stripper
-    def sd_size(self, s):
-        self.__sd_size = s
+    def as_dict(self):
+        return {name: getattr(self, name) for name in Release.FIELDS}
 
 
     def __repr__(self):
-        return "%s(%r, %r, %r, %r, %r, %r, %r, %r, %r, %r, %r, %r, %r, %r)" % (
-            self.__class__.__name__, self.project_id, self.project_model,
-            self.apps_ectaco, self.apps_other, self.voice_dictionary,
-            self.voice_phrasebook, self.photo_text, self.ulearn, self.ulearn2,
-            self.feature_tts, self.feature_sr, self.feature_gt,
-            self.feature_jibbigo, self.sd_size)
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+                    repr(getattr(self, name)) for name in Release.FIELDS))
+
 
     def __iadd__(self, other):
         if isinstance(other, Release):
-            self.__project_id = other.project_id
-            self.project_model = other.project_model
-            self.apps_ectaco = other.apps_ectaco
-            self.apps_other = other.apps_other
-            self.voice_dictionary = other.voice_dictionary
-            self.voice_phrasebook = other.voice_phrasebook
-            self.photo_text = other.photo_text
-            self.ulearn = other.ulearn
-            self.ulearn2 = other.ulearn2
-            self.feature_tts = other.feature_tts
-            self.feature_sr = other.feature_sr
-            self.feature_gt = other.feature_gt
-            self.feature_jibbigo = other.feature_jibbigo
-            self.sd_size = other.sd_size
+            for name in Release.FIELDS:
+                setattr(self, name, getattr(other, name))
+        return self
 
 
 # noinspection PyCompatibility
 class Analizer(object):
-    def __init__(self, filename):
-        facet = {'_set_apps_ectaco': 'apps_ectaco',
-                 '_set_apps_other': 'apps_other',
-                 '_set_feature_tts': 'feature_tts',
-                 '_set_feature_sr': 'feature_sr',
-                 '_set_feature_gt': 'feature_gt',
-                 '_set_voice_dictionary': 'voice_dictionary',
-                 '_set_voice_phrasebook': 'voice_phrasebook',
-                 '_set_photo_text': 'photo_text',
-                 '_set_ulearn': 'ulearn',
-                 '_set_ulearn2': 'ulearn2',
-                 '_set_feature_jibbigo': 'feature_jibbigo'}
+    _IMAGES = ('system.img', 'userdata.img', 'ext.img')
+    _ARCHIVE_ERRORS = (OSError, KeyError, ValueError, tarfile.TarError,
+                       subprocess.SubprocessError, zipfile.BadZipFile)
+    # Unpacked size / archive size, to reserve scratch space unlisted
+    _UNPACKED_RATIO = 3
+
+
+    _FACETS = {'_set_apps_ectaco': 'apps_ectaco',
+               '_set_apps_other': 'apps_other',
+               '_set_feature_tts': 'feature_tts',
+               '_set_feature_sr': 'feature_sr',
+               '_set_feature_gt': 'feature_gt',
+               '_set_voice_dictionary': 'voice_dictionary',
+               '_set_voice_phrasebook': 'voice_phrasebook',
+               '_set_photo_text': 'photo_text',
+               '_set_ulearn': 'ulearn',
+               '_set_ulearn2': 'ulearn2',
+               '_set_feature_jibbigo': 'feature_jibbigo'}
+
+
+    def __init__(self, filename, listing=True):
+        """Classify the archive by the listing of its members
+
+        Only the members needed are extracted, unless listing is False or
+        the archive cannot be listed: then it is unpacked as a whole.
+        """
+        facet = Analizer._FACETS
         for f in facet:
             self.__setattr__(f, set())
         self._data = collections.defaultdict(lambda: str())
         self._data['project_model'], self._data['sd_size'] = '', ''
         self._data['project_id'] = os.path.basename(filename)
-        ext = os.path.splitext(filename)[1].lower()
-        with TempDir() as tempdir:
-            if ext in ('.7z', '.exe'):
-                Analizer._unpack_7z(filename, tempdir)
-            elif ext == '.zip':
-                os.system('unzip %s -d %s >/dev/null 2>&1' %
-                          (filename, tempdir))
-            self._scan(tempdir, self._data)
+        self._listing = listing
+        # The SD card archives seen and the bytes in each top folder
+        self._cards = 0
+        self._card_sizes = collections.Counter()
+        METRICS.temp_peak = 0
+        with METRICS.stage('analyze', self._data['project_id']) as record:
+            self._analyze(filename, listing)
+            record['bytes'] = os.path.getsize(filename)
+            record['temp_peak'] = METRICS.temp_peak
+        if self._cards:
+            sizes = self._card_sizes
+            self._data['sd_size'] = '%.2f GB' % (1e-9 * sum(sizes.values()))
+            self._data['sd_folders'] = ', '.join(
+                '%s %.2f GB' % (name, 1e-9 * sizes[name])
+                for name in sorted(sizes, key=str.lower))
         glue = lambda x: ', '.join(sorted(x, key=str.lower))
         self._data.update(
                     {facet[f]: glue(self.__getattribute__(f)) for f in facet})
 
 
+    def _analyze(self, filename, listing):
+        members = None
+        try:
+            with METRICS.stage('list') as record:
+                members = Analizer._list_archive(filename)
+                record['bytes'] = members.size
+                record['files'] = len(members)
+        except Analizer._ARCHIVE_ERRORS as err:
+            logger.warning('Cannot list "%s", extract it: %s' %
+                           (os.path.basename(filename), err))
+        if listing and members is not None:
+            with SCRATCH.reserve(Analizer._extracted_size(members)), \
+                    METRICS.stage('scan') as record:
+                self._scan_listing(members, self._data, record=record)
+        else:
+            # Without the listing the size is a guess.
+            size = (members.size if members is not None else
+                    Analizer._UNPACKED_RATIO * os.path.getsize(filename))
+            with SCRATCH.reserve(size), TempDir() as tempdir:
+                Analizer._unpack([(filename, tempdir)])
+                with METRICS.stage('scan') as record:
+                    self._scan(tempdir, self._data, record=record)
+
+
+    @staticmethod
+    def _extracted_size(tree):
+        """The bytes _scan_listing extracts from the tree, images included"""
+        size = 0
+        for root, dirs, files in tree.walk():
+            for f in files:
+                if (f in Analizer._IMAGES or f == 'build.prop' or
+                        (Analizer._is_card(f) and
+                         not Analizer._streams_card(tree, f))):
+                    size += tree.getsize(os.path.join(root, f))
+        return size
+
+
+    @staticmethod
+    def _is_card(name):
+        return name in ('sdcard.zip', 'sdcard.7z') or name.endswith('.tar.gz')
+
+
+    @staticmethod
+    def _streams_card(tree, name):
+        """True if the SD card archive is read right out of the tree"""
+        return (isinstance(tree, ArchiveListing) and tree.streams and
+                Unpacker.kind(name) != '7z')
+
+
     @property
     def data(self):
         return copy.deepcopy(self._data)
 
 
     @staticmethod
-    def _size_GB(path):
-        return 1e-9 * sum([os.path.getsize(os.path.join(a, f))
-                           for a, b, c in os.walk(path) for f in c])
+    def _walk(top, sizes=False):
+        """os.walk yielding also the total size of the files in each folder
+
+        The sizes are taken from the scandir entries, only if asked for.
+        """
+        dirs, files, size = [], [], 0
+        try:
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                        continue
+                    files.append(entry.name)
+                    if sizes:
+                        try:
+                            size += entry.stat().st_size
+                        except OSError as err:
+                            logger.error(err)
+        except OSError as err:
+            logger.error(err)
+            return
+        yield top, dirs, files, size
+        for d in dirs:
+            path = os.path.join(top, d)
+            if not os.path.islink(path):
+                yield from Analizer._walk(path, sizes)
 
 
-    # noinspection PyUnresolvedReferences
-    def _scan(self, path, data, card=False):
-        for root, dirs, files in os.walk(path):
+    @staticmethod
+    def _top_folder(root):
+        """The first folder of the relative root, "." for the top itself"""
+        return root.replace(os.sep, '/').split('/', 1)[0] or '.'
+
+
+    def _scan(self, path, data, card=False, record=None):
+        """Walk the extracted files, count them in the metrics record
+
+        The files of an SD card are added up by the top folders.
+        """
+        for root, dirs, files, size in Analizer._walk(path, card):
+            if record is not None:
+                record['files'] += len(files)
+            if card and files:
+                self._card_sizes[Analizer._top_folder(
+                                    os.path.relpath(root, path))] += size
+            cards = []
             for f in files:
-                name, ext = os.path.splitext(f)
-                if f in ('system.img', 'userdata.img', 'ext.img'):
-                    with ExtDir(os.path.join(root, f), path) as img:
-                        self._scan(img, data)
-                    continue
+                if f in Analizer._IMAGES:
+                    self._scan_image(os.path.join(root, f), path, data)
                 elif f == "build.prop":
                     try:
                         data['project_model'] = Analizer._get_project_model(
@@ -464,83 +1094,192 @@ class Analizer(object):
                     except OSError as e:
                         data['project_model'] = 'unknown'
                         logger.error(e)
-                elif f == 'sdcard.zip':
-                    with TempDir(path) as sdcard:
-                        os.system('unzip %s -d %s >/dev/null 2>&1' %
-                                  (os.path.join(path, f), sdcard))
-                        self._scan(sdcard, data, True)
-                        data['sd_size'] = '%.2f GB' % Analizer._size_GB(sdcard)
-                elif f == 'sdcard.7z':
-                    with TempDir(path) as sdcard:
-                        Analizer._unpack_7z(os.path.join(path, f), sdcard)
-                        self._scan(sdcard, data, True)
-                        data['sd_size'] = '%.2f GB' % Analizer._size_GB(sdcard)
-                elif f.endswith('.tar.gz'):
-                    with TempDir(path) as sdcard:
-                        Analizer._unpack_tgz(os.path.join(path, f), sdcard)
-                        self._scan(sdcard, data, True)
-                        data['sd_size'] = '%.2f GB' % Analizer._size_GB(sdcard)
-
-                if ext == ".apk":
-                    if f in Settings.blacklog:
-                        continue
-                    else:
-                        a, b = Analizer._get_application(f)
-                    if a:
-                        self._set_apps_ectaco.add(a)
-                    if b:
-                        self._set_apps_other.add(b)
-                elif ext == ".txt":
-                    if card:
-                        set_ = {'{0} SD'.format(i)
-                                for i in Analizer._get_lang_ext(f, ext)}
-                        self._set_feature_gt.update(set_)
-                    else:
-                        self._set_feature_gt.update(
-                                            Analizer._get_lang_ext(f, ext))
-                elif ext == ".pil":
-                    self._set_feature_tts.update(Analizer._get_tts(f))
-                elif ext == ".snd":
-                    if card:
-                        set_ = {'{0} SD'.format(i) for i in
-                                    Analizer._get_lang_tv(f, 'dictionary')}
-                        self._set_voice_dictionary.update(set_)
-                        set_ = {'{0} SD'.format(i) for i in
-                                    Analizer._get_lang_tv(f, 'phrasebook')}
-                        self._set_voice_phrasebook.update(set_)
-                    else:
-                        self._set_voice_dictionary.update(
-                                    Analizer._get_lang_tv(f, 'dictionary'))
-                        self._set_voice_phrasebook.update(
-                                    Analizer._get_lang_tv(f, 'phrasebook'))
-                elif ext == ".s2s":
-                    if card:
-                        set_ = {'{0} SD'.format(i) for i in
-                                    Analizer._get_lang_ext(f, ext)}
-                        self._set_feature_jibbigo.update(set_)
-                    else:
-                        self._set_feature_jibbigo.update(
-                                            Analizer._get_lang_ext(f, ext))
-                elif ext == '.traineddata':
-                    self._set_photo_text.update(
-                                            Analizer._get_photo_text(name))
-            for d in dirs:
-                if d == "srec":
-                    self._set_feature_sr.update(
-                            Analizer._get_feature_sr(os.path.join(root, d)))
-                elif d == 'com.ectaco.ul':
-                    self._set_ulearn.update(
-                            Analizer._get_lang_ulearn(os.path.join(root, d)))
-                elif d == 'com.ectaco.ul2':
-                    self._set_ulearn2.update(
-                            Analizer._get_lang_ulearn(os.path.join(root, d)))
+                elif Analizer._is_card(f):
+                    cards.append(os.path.join(root, f))
+            if self._listing:
+                cards = [c for c in cards
+                         if not self._scan_card(c, data, record)]
+            if cards:
+                # The SD card archives of the folder are unpacked together.
+                with contextlib.ExitStack() as stack:
+                    folders = [stack.enter_context(TempDir(path))
+                               for _ in cards]
+                    Analizer._unpack(list(zip(cards, folders)))
+                    for sdcard in folders:
+                        self._cards += 1
+                        self._scan(sdcard, data, True, record)
+            self._classify(root, dirs, files, card)
         return data
 
 
+    def _scan_listing(self, tree, data, card=False, record=None):
+        """The same as _scan but nothing is extracted in advance
+
+        The tree is an ArchiveListing or an Ext4Image. Only build.prop, the
+        ext4 images and the SD card archives are extracted, everything else
+        is classified by the names.
+        """
+        for root, dirs, files in tree.walk():
+            if record is not None:
+                record['files'] += len(files)
+            for f in files:
+                member = os.path.join(root, f)
+                if f in Analizer._IMAGES:
+                    with TempDir() as tempdir:
+                        self._scan_image(tree.extract(member, tempdir),
+                                         tempdir, data, record)
+                elif f == "build.prop":
+                    try:
+                        with TempDir() as tempdir:
+                            data['project_model'] = (
+                                Analizer._get_project_model(
+                                    tree.extract(member, tempdir)))
+                    except Analizer._ARCHIVE_ERRORS as e:
+                        data['project_model'] = 'unknown'
+                        logger.error(e)
+                elif Analizer._is_card(f):
+                    with contextlib.ExitStack() as stack:
+                        if Analizer._streams_card(tree, f):
+                            card_members = Analizer._list_archive(member,
+                                                                  tree)
+                        else:
+                            tempdir = stack.enter_context(TempDir())
+                            card_members = Analizer._list_archive(
+                                                tree.extract(member, tempdir))
+                        self._add_card(card_members, data, record)
+            self._classify(root, dirs, files, card, tree.listdir)
+        return data
+
+
+    def _scan_card(self, filename, data, record=None):
+        """Scan the SD card archive by its listing, False if not listed"""
+        try:
+            card_members = Analizer._list_archive(filename)
+        except Analizer._ARCHIVE_ERRORS as err:
+            logger.warning('Cannot list "%s", extract it: %s' %
+                           (os.path.basename(filename), err))
+            return False
+        self._add_card(card_members, data, record)
+        return True
+
+
+    def _add_card(self, card_members, data, record=None):
+        """Scan the listing of an SD card archive and add up its sizes"""
+        self._cards += 1
+        self._card_sizes.update(card_members.sizes())
+        self._scan_listing(card_members, data, True, record)
+
+
+    def _scan_image(self, filename, path, data, record=None):
+        """Scan the ext4 image, mount it only if it cannot be read
+
+        A truncated or corrupt image may fail in the middle of the scan.
+        The counts of the part scanned are dropped, the facets found are
+        found again on the mount.
+        """
+        files = record['files'] if record is not None else 0
+        cards, card_sizes = self._cards, self._card_sizes.copy()
+        try:
+            with Ext4Image(filename) as image:
+                self._scan_listing(image, data, record=record)
+        except (OSError, ValueError, KeyError, struct.error) as err:
+            logger.warning('Cannot read "%s", mount it: %s' %
+                           (os.path.basename(filename), err))
+            if record is not None:
+                record['files'] = files
+            self._cards, self._card_sizes = cards, card_sizes
+            with ExtDir(filename, path) as img:
+                self._scan(img, data, record=record)
+
+
+    def _classify(self, root, dirs, files, card=False, listdir=os.listdir):
+        """Update the facets by the names of one folder"""
+        facets_of = Analizer._facets_of
+        for f in files:
+            for facet, values in facets_of(f, card):
+                getattr(self, facet).update(values)
+        for d in dirs:
+            if d == "srec":
+                self._set_feature_sr.update(Analizer._get_feature_sr(
+                                        os.path.join(root, d), listdir))
+            elif d == 'com.ectaco.ul':
+                self._set_ulearn.update(Analizer._get_lang_ulearn(
+                                        os.path.join(root, d), listdir))
+            elif d == 'com.ectaco.ul2':
+                self._set_ulearn2.update(Analizer._get_lang_ulearn(
+                                        os.path.join(root, d), listdir))
+
+
     @staticmethod
-    def _get_lang_ulearn(folder):
+    def _facets_apk(filename, name, ext, card):
+        if filename in Settings.blacklog:
+            return ()
+        a, b = Analizer._get_application(filename)
+        return (('_set_apps_ectaco', (a,) if a else ()),
+                ('_set_apps_other', (b,) if b else ()))
+
+
+    @staticmethod
+    def _facets_txt(filename, name, ext, card):
+        return ('_set_feature_gt',
+                Analizer._card(Analizer._get_lang_ext(filename, ext), card)),
+
+
+    @staticmethod
+    def _facets_pil(filename, name, ext, card):
+        return ('_set_feature_tts', Analizer._get_tts(filename)),
+
+
+    @staticmethod
+    def _facets_snd(filename, name, ext, card):
+        return (('_set_voice_dictionary', Analizer._card(
+                    Analizer._get_lang_tv(filename, 'dictionary'), card)),
+                ('_set_voice_phrasebook', Analizer._card(
+                    Analizer._get_lang_tv(filename, 'phrasebook'), card)))
+
+
+    @staticmethod
+    def _facets_s2s(filename, name, ext, card):
+        return ('_set_feature_jibbigo',
+                Analizer._card(Analizer._get_lang_ext(filename, ext), card)),
+
+
+    @staticmethod
+    def _facets_traineddata(filename, name, ext, card):
+        return ('_set_photo_text', Analizer._get_photo_text(name)),
+
+
+    _BY_EXT = {'.apk': _facets_apk.__func__,
+               '.txt': _facets_txt.__func__,
+               '.pil': _facets_pil.__func__,
+               '.snd': _facets_snd.__func__,
+               '.s2s': _facets_s2s.__func__,
+               '.traineddata': _facets_traineddata.__func__}
+
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def _facets_of(filename, card=False):
+        """((facet set, values), ...) given by the file name"""
+        name, ext = os.path.splitext(filename)
+        facets = Analizer._BY_EXT.get(ext)
+        if facets is None:
+            return ()
+        return tuple((f, v) for f, v in facets(filename, name, ext, card) if v)
+
+
+    @staticmethod
+    def _card(values, card):
+        """Mark the languages which are on the SD card"""
+        if card:
+            return frozenset('{0} SD'.format(i) for i in values)
+        return frozenset(values)
+
+
+    @staticmethod
+    def _get_lang_ulearn(folder, listdir=os.listdir):
         result = set()
-        for d in os.listdir(folder):
+        for d in listdir(folder):
             match = Settings.lang_ulearn.match(d)
             if match is None:
                 continue
@@ -596,47 +1335,104 @@ class Analizer(object):
     @staticmethod
     def _get_application(filename):
         name, ext = os.path.splitext(filename)
-        appnames = Settings.appnames
-        apk = appnames[filename] if filename in appnames else name
-        sup = {name.split(s)[0] for s in ('_', '-')}
-        sup.add(filename)
-        if sup & Settings.suite:
+        apk = Settings.appnames.get(filename, name)
+        suite = Settings.suite
+        if (filename in suite or name.split('_')[0] in suite or
+                name.split('-')[0] in suite):
             return (apk, '')
         else:
             return ('', apk)
 
 
     @staticmethod
-    def _unpack_7z(src, dst):
-        assert os.access(src, os.F_OK), 'file not found'
-        assert os.path.isdir(dst), 'invalid directory'
-        ext = os.path.splitext(src)[1].lower()
-        assert ext in ('.exe','.7z'
-               ), '"%s" is not a format. Known formats are EXE and 7Z.' % ext
-        name = os.path.basename(src)
-        if ext == '.exe' :
-            name = os.path.basename(".".join((os.path.splitext(src)[0], "7z")))
-        os.system('ln -s {0} {1}'.format(src, os.path.join(dst, name)))
-        try:
-            os.chdir(dst)
-            os.system('p7zip -d %s  >/dev/null 2>&1' % name)
-        except FileNotFoundError as err:
-            logger.error(err)
+    def _unpack(jobs):
+        """Unpack the (archive, folder) pairs at the same time
+
+        A failed archiver is logged, the folder keeps what was unpacked.
+        """
+        unpackers = []
+        for src, dst in jobs:
+            try:
+                unpackers.append(Unpacker(src, dst).start())
+            except (OSError, ValueError) as err:
+                logger.error('Cannot unpack "%s": %s' %
+                             (os.path.basename(src), err))
+        for unpacker in unpackers:
+            try:
+                unpacker.wait()
+            except subprocess.CalledProcessError as err:
+                logger.error(err)
+                logger.error(err.stderr)
 
 
     @staticmethod
-    def _unpack_tgz(src, dst):
-        assert os.access(src, os.F_OK), 'file not found'
+    def _list_archive(filename, parent=None):
+        """The ArchiveListing of a ZIP, 7Z (EXE) or TAR.GZ archive
+
+        The filename is a member of the parent listing if the parent is
+        given; it is read from there (ZIP and TAR.GZ only).
+        """
+        kind = Unpacker.kind(filename)
+        if kind == '7z' and parent is None:
+            listing = subprocess.run(['7z', 'l', '-slt', filename],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, check=True,
+                                     universal_newlines=True).stdout
+            return ArchiveListing(filename,
+                                  Analizer._parse_7z_listing(listing))
+        elif kind not in ('zip', 'tgz'):
+            raise ValueError('"%s" is not a format. Known formats are EXE, '
+                             '7Z, ZIP, and TAR.GZ.' %
+                             os.path.basename(filename))
+        with (open(filename, 'rb') if parent is None
+              else parent.open(filename)) as fp:
+            if kind == 'zip':
+                with zipfile.ZipFile(fp) as archive:
+                    members = [(i.filename, i.file_size, i.is_dir())
+                               for i in archive.infolist()]
+            else:
+                with tarfile.open(fileobj=fp, mode='r:gz') as archive:
+                    members = [(i.name, i.size, i.isdir()) for i in archive]
+        return ArchiveListing(filename, members, parent)
+
+
+    @staticmethod
+    def _parse_7z_listing(listing):
+        """Yield (name, size, is_dir) from the output of 7z l -slt"""
+        def member(e):
+            return (e['Path'], int(e.get('Size') or 0),
+                    e.get('Folder') == '+' or
+                    e.get('Attributes', '').startswith('D'))
+        # The members follow the dashed line, separated by empty lines.
+        entry = None
+        for line in listing.splitlines():
+            if line.startswith('----------'):
+                entry = {}
+            elif entry is None:
+                continue
+            elif not line.strip():
+                if 'Path' in entry:
+                    yield member(entry)
+                entry = {}
+            elif ' = ' in line:
+                key, value = line.split(' = ', 1)
+                entry[key] = value
+        if entry and 'Path' in entry:
+            yield member(entry)
+
+
+    @staticmethod
+    def _extract_member(src, member, dst):
+        """Extract one member of the 7Z archive and return its path"""
         assert os.path.isdir(dst), 'invalid directory'
-        name = os.path.basename(src)
-        shutil.move(src, os.path.join(dst, name))
-        os.system('sync')
-        try:
-            os.chdir(dst)
-            os.system('tar xzf %s' % name)
-            os.remove(name)
-        except FileNotFoundError as err:
-            logger.error(err)
+        with METRICS.stage('extract') as record:
+            subprocess.run(['7z', 'x', '-y', '-o' + dst, src, member],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=True)
+            result = os.path.join(dst, member)
+            record['bytes'] = os.path.getsize(result)
+            record['files'] = 1
+        return result
 
 
     @staticmethod
@@ -651,9 +1447,9 @@ class Analizer(object):
 
 
     @staticmethod
-    def _get_feature_sr(path):
+    def _get_feature_sr(path, listdir=os.listdir):
         result = set()
-        for n in os.listdir(path):
+        for n in listdir(path):
             m = n.split('-')[0]
             if m in Settings.languages.keys():
                 result.add(Settings.languages[m][0])
@@ -662,23 +1458,186 @@ class Analizer(object):
 
     @staticmethod
     def _get_photo_text(name):
-        result = tuple()
-        if len(name) < 3:
-            return result
-        a = name[:3].lower()
-        for v in Settings.languages.values():
-            if a == v[2]:
-                result = v[0],
-                break
+        language = Settings.languages_by_iso639_2.get(name[:3].lower())
+        if len(name) < 3 or language is None:
+            return tuple()
+        return language,
+
+
+@contextlib.contextmanager
+def atomic_writer(filename, mode='w', encoding=None, buffering=-1):
+    """Write to a temporary file and rename it over filename on success
+
+    Readers of filename see either the old or the new file, never a part.
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, name = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with open(fd, mode, buffering, encoding=encoding) as fp:
+            yield fp
+        os.chmod(name, 0o644)
+        os.replace(name, filename)
+    except BaseException:
+        if os.access(name, os.F_OK):
+            os.remove(name)
+        raise
+
+
+class AnalysisCache(object):
+    """Analizer data of archives keyed by path, size, mtime and digest
+
+    The cache is a JSON-lines file: one archive per line.
+    """
+    def __init__(self, filename, digest=False):
+        self._filename = filename
+        self._digest = digest
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+
+    @property
+    def filename(self):
+        """The JSON-lines file"""
+        return self._filename
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._entries
+
+
+    def load(self):
+        self._entries.clear()
+        if not os.access(self._filename, os.F_OK):
+            return False
+        with open(self._filename, 'r', encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                    self._entries[entry['path']] = entry
+                except (ValueError, KeyError) as err:
+                    logger.warning('Broken cache entry in "%s": %s' %
+                                   (self._filename, err))
+        return True
+
+
+    def save(self):
+        if not self._dirty:
+            return False
+        try:
+            with atomic_writer(self._filename, encoding='utf8') as fp:
+                for path in sorted(self._entries):
+                    fp.write(json.dumps(self._entries[path], sort_keys=True))
+                    fp.write('\n')
+        except OSError as err:
+            logger.error('An error occured to save %s' % self._filename)
+            logger.error(err)
+            return False
+        self._dirty = False
+        return True
+
+
+    def signature(self, path):
+        """The size, mtime and optional SHA-1 of the archive"""
+        st = os.stat(path)
+        result = {'size': st.st_size, 'mtime': st.st_mtime}
+        if self._digest:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b''):
+                    sha1.update(chunk)
+            result['sha1'] = sha1.hexdigest()
         return result
 
 
+    def get(self, path):
+        """The cached data or None if the archive is unknown or changed"""
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        try:
+            signature = self.signature(path)
+        except OSError:
+            return None
+        if any(entry.get(k) != v for k, v in signature.items()):
+            return None
+        return dict(entry['data'])
+
+
+    def put(self, path, data):
+        path = os.path.abspath(path)
+        try:
+            entry = self.signature(path)
+        except OSError as err:
+            logger.error(err)
+            return
+        entry.update({'path': path, 'data': dict(data)})
+        self._entries[path] = entry
+        self._dirty = True
+
+
+    def releases(self):
+        """{file name: data} of the cached archives"""
+        return {os.path.basename(p): dict(e['data'])
+                for p, e in self._entries.items()}
+
+
+    def retain(self, paths):
+        """Evict the entries of archives which are not in paths"""
+        keep = {os.path.abspath(p) for p in paths}
+        for path in [p for p in self._entries if p not in keep]:
+            logger.info('Evict "%s" from cache' % os.path.basename(path))
+            del self._entries[path]
+            self._dirty = True
+
+
+def _init_worker(scratch, walk):
+    """Share the scratch budget and the metrics mode with a pool worker"""
+    global SCRATCH
+    SCRATCH = scratch
+    METRICS.walk = walk
+
+
+def _analyze(filename):
+    """Analyze one archive in a pool worker
+
+    Return the picklable data and the metrics records of the archive.
+    """
+    logger.info('Analyze file "%s"' % os.path.basename(filename))
+    METRICS.clear()
+    return dict(Analizer(filename).data), list(METRICS.records)
+
+
 # noinspection PyCompatibility
 class ReleaseCollection(dict):
     _TESTING = re.compile('(eval|test)', re.IGNORECASE)
     _LUX = 'ftp://backbsd.ectaco.ru/Lux'
     _SG = 'ftp://backbsd.ectaco.ru/Runbo'
     _PEFIXES = ('lux', 'sg')
+    _ARCHIVES = ('.7z', '.exe', '.zip')
+
+
+    def __init__(self, *args, workers=1, cache=None, force=False,
+                 incremental=False, pages=0, view=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+        self.cache = cache
+        self.force = force
+        self.incremental = incremental
+        # The HTML report: one page (0), pages of N releases or a page per
+        # prefix ('prefix') and an index page; and a virtual view page
+        self.pages = pages
+        self.view = view
+        # project_id of releases added, removed or analyzed since the last
+        # export and, during a complete export, the rendered releases
+        # {extension: {project_id: text}}
+        self.dirty = set()
+        self._fragments = None
 
 
     # noinspection PyMethodOverriding
@@ -709,15 +1668,16 @@ class ReleaseCollection(dict):
         if os.path.isdir(path):
             self.__import_dir(path)
             return True
-        call = {'.xml': self.import_xml, '.json': self.import_json}
+        call = {'.xml': self.import_xml, '.json': self.import_json,
+                '.bin': self.import_snapshot}
         ext = os.path.splitext(path)[1].lower()
         if ext in call:
             logger.info('Import data from "%s"' % os.path.basename(path))
             call[ext](path)
             return True
         else:
-            logger.warning(
-               '"%s" is not a format. Known formats are XML and JSON.' % ext)
+            logger.warning('"%s" is not a format. Known formats are XML, '
+                           'JSON and the snapshot.' % ext)
             return False
 
 
@@ -730,16 +1690,35 @@ class ReleaseCollection(dict):
                 '.htm': self.export_html,
                 '.html': self.export_html,
                 '.txt': self.export_text,
-                '.json': self.export_json
+                '.json': self.export_json,
+                '.bin': self.export_snapshot
         }
         if complete:
             name = os.path.splitext(filename)[0].lower()
-            for f in (name + x for x in ('.xml', '.html', '.txt', '.json')):
-                if not self.export(f, complete=False):
-                    return False
+            store = '_'.join((name, 'fragments.json'))
+            self._load_fragments(store)
+            exported = [name + x for x in ('.xml', '.html', '.txt', '.json')]
+            try:
+                for f in exported:
+                    if not self.export(f, complete=False):
+                        return False
+                # Even a full export, the next incremental one starts here.
+                self._save_fragments(store)
+            finally:
+                self._fragments = None
+            with METRICS.stage('export.index', ''):
+                ReleaseIndex.build(self).save(ReleaseIndex.filename(filename))
+            if not self.export(ReleaseSnapshot.filename(filename)):
+                return False
+            self.dirty.clear()
+            if filename in exported:
+                return True
         if ext in call:
             logger.info('Export data to "%s"' % os.path.basename(filename))
-            call[ext](filename)
+            with METRICS.stage('export' + ext, '') as record:
+                call[ext](filename)
+                if os.access(filename, os.F_OK):
+                    record['bytes'] = os.path.getsize(filename)
             if os.access(filename, os.F_OK):
                 if ext in ('.xml', '.htm', '.html'):
                     css = 'style.css'
@@ -760,15 +1739,7 @@ class ReleaseCollection(dict):
             return False
 
 
-    def export_text(self, filename):
-        wrapper = textwrap.TextWrapper(initial_indent="    ",
-                                       subsequent_indent="    ")
-        with open(filename, 'w', encoding='utf8') as fp:
-            for release in self.values():
-                apps_ectaco = '\n'.join(wrapper.wrap(release.apps_ectaco))
-                apps_other = '\n'.join(wrapper.wrap(release.apps_other))
-                dash_name = '=' * len(release.project_id)
-                s = """{0.project_id}
+    _TEXT = """{0.project_id}
 {dash_name}
 Model: {0.project_model}
 
@@ -793,35 +1764,115 @@ Ectaco Applications
 SD card
 -------
 Size: {0.sd_size}
+Folders: {0.sd_folders}
 
 *****\n
-""".format(release, dash_name=dash_name, apps_ectaco=apps_ectaco,
-           apps_other=apps_other)
-                fp.write(s)
+"""
+
+
+    def export_text(self, filename):
+        """Write the text report, "-" is the standard output"""
+        if filename == '-':
+            self.write_text(sys.stdout)
+            sys.stdout.flush()
+            return
+        with atomic_writer(filename, encoding='utf8',
+                           buffering=1 << 20) as fp:
+            self.write_text(fp)
+
+
+    def write_text(self, fp):
+        """Write the text report to a file object, a pipe for instance"""
+        template = ReleaseCollection._TEXT.format
+        wrap = ReleaseCollection._text_wrapper()
+
+        def render(release):
+            return template(release, dash_name='=' * len(release.project_id),
+                            apps_ectaco=wrap(release.apps_ectaco),
+                            apps_other=wrap(release.apps_other))
+
+        fp.writelines(ReleaseCollection._batches(
+                                        self._render('.txt', render)))
+
+
+    @staticmethod
+    def _batches(texts, size=1 << 20):
+        """Join the texts into about size long strings"""
+        batch, length = [], 0
+        for text in texts:
+            batch.append(text)
+            length += len(text)
+            if length >= size:
+                yield ''.join(batch)
+                batch, length = [], 0
+        if batch:
+            yield ''.join(batch)
+
+
+    @staticmethod
+    def _text_wrapper(width=70, indent='    '):
+        """'\\n'.join(TextWrapper(...).wrap(text)), memoized
+
+        Splitting the text into chunks is the slow part of TextWrapper.
+        The words separated by single spaces are split on their own, so
+        an app name is split once per export, not once per release; then
+        the chunks are filled into lines as TextWrapper does. Tabs, runs
+        of spaces and words longer than a line are left to TextWrapper.
+        """
+        wrapper = textwrap.TextWrapper(width=width, initial_indent=indent,
+                                       subsequent_indent=indent)
+        room = width - len(indent)
+        chunks_of = {}
+        wrapped = {}
+
+        def wrap(text):
+            result = wrapped.get(text)
+            if result is not None:
+                return result
+            chunks = []
+            if (text and text[0] != ' ' and text[-1] != ' ' and
+                    '  ' not in text and text.isprintable()):
+                for word in text.split(' '):
+                    c = chunks_of.get(word)
+                    if c is None:
+                        c = chunks_of[word] = wrapper._split(word)
+                    chunks.extend(c)
+                    chunks.append(' ')
+                chunks.pop()
+            if not chunks or max(map(len, chunks)) > room:
+                result = '\n'.join(wrapper.wrap(text))
+            else:
+                lines, i, count = [], 0, len(chunks)
+                while i < count:
+                    if lines and chunks[i] == ' ':
+                        i += 1
+                    first, length = i, 0
+                    while i < count and length + len(chunks[i]) <= room:
+                        length += len(chunks[i])
+                        i += 1
+                    last = i - 1 if chunks[i - 1] == ' ' else i
+                    lines.append(indent + ''.join(chunks[first:last]))
+                result = '\n'.join(lines)
+            wrapped[text] = result
+            return result
+
+        return wrap
 
 
     def export_json(self, filename):
-        d = {r.project_id: {'project_id': r.project_id,
-                            'project_model': r.project_model,
-                            'apps_ectaco': r.apps_ectaco,
-                            'apps_other': r.apps_other,
-                            'voice_dictionary': r.voice_dictionary,
-                            'voice_phrasebook': r.voice_phrasebook,
-                            'photo_text': r.photo_text,
-                            'ulearn': r.ulearn,
-                            'ulearn2': r.ulearn2,
-                            'feature_tts': r.feature_tts,
-                            'feature_sr': r.feature_sr,
-                            'feature_gt': r.feature_gt,
-                            'feature_jibbigo': r.feature_jibbigo,
-                            'sd_size': r.sd_size
-        } for r in self.values()}
-        with open(filename, 'w') as fp:
-            json.dump(d, fp, indent='  ')
+        def render(r):
+            # Drop the braces, the same as the item in the whole dict.
+            return json.dumps({r.project_id: r.as_dict()}, indent='  ')[2:-2]
+
+        with atomic_writer(filename) as fp:
+            fp.write('{\n')
+            for i, text in enumerate(self._render('.json', render)):
+                fp.write(',\n' + text if i else text)
+            fp.write('\n}')
 
 
     def import_json(self, filename):
-        if os.access(filename, os.F_OK):
+        if not os.access(filename, os.F_OK):
             return False
         self.clear()
         with open(filename, 'r') as fp:
@@ -835,52 +1886,53 @@ Size: {0.sd_size}
             return False
 
 
-    def import_xml(self, filename):
+    def export_snapshot(self, filename):
+        ReleaseSnapshot.save(self, filename)
+
+
+    def import_snapshot(self, filename):
         if not os.access(filename, os.F_OK):
             return False
+        self.clear()
+        with ReleaseSnapshot(filename) as snapshot:
+            for release in snapshot.releases():
+                self[release.project_id] = release
+        if any(self.keys()):
+            return True
+        else:
+            return False
 
-        def get_text(node_list):
-            text = []
-            for node in node_list:
-                if node.nodeType == node.TEXT_NODE:
-                    text.append(node.data)
-            return "".join(text).strip()
 
-        dom = xml.dom.minidom.parse(filename)
+    def import_xml(self, filename):
+        if not os.access(filename, os.F_OK):
+            return False
+        schema = collections.defaultdict(list)
+        for name, place in Release.SCHEMA:
+            schema[place].append(name)
+        fields = schema['element'] + schema['features']
         self.clear()
-        for element in dom.getElementsByTagName('release'):
-            data = collections.defaultdict(lambda: str())
-            data["project_id"] = element.getAttribute('project_id')
-            data["project_model"] = element.getAttribute('project_model')
-            apps_ectaco = element.getElementsByTagName('apps_ectaco')[0]
-            data['apps_ectaco'] = get_text(apps_ectaco.childNodes)
-            apps_other = element.getElementsByTagName('apps_other')[0]
-            data['apps_other'] = get_text(apps_other.childNodes)
-            voice_dictionary = element.getElementsByTagName(
-                                                    'voice_dictionary')[0]
-            data['voice_dictionary'] = get_text(voice_dictionary.childNodes)
-            voice_phrasebook = element.getElementsByTagName(
-                                                    'voice_phrasebook')[0]
-            data['voice_phrasebook'] = get_text(voice_phrasebook.childNodes)
-            photo_text = element.getElementsByTagName('photo_text')[0]
-            data['photo_text'] = get_text(photo_text.childNodes)
-            ulearn = element.getElementsByTagName('ulearn')[0]
-            data['ulearn'] = get_text(ulearn.childNodes)
-            ulearn2 = element.getElementsByTagName('ulearn2')[0]
-            data['ulearn2'] = get_text(ulearn2.childNodes)
-            feature_tts = element.getElementsByTagName('feature_tts')[0]
-            data['feature_tts'] = get_text(feature_tts.childNodes)
-            feature_sr = element.getElementsByTagName('feature_sr')[0]
-            data['feature_sr'] = get_text(feature_sr.childNodes)
-            feature_gt = element.getElementsByTagName('feature_gt')[0]
-            data['feature_gt'] = get_text(feature_gt.childNodes)
-            feature_jibbigo = element.getElementsByTagName(
-                                                   'feature_jibbigo')[0]
-            data['feature_jibbigo'] = get_text(feature_jibbigo.childNodes)
-            sdcard = element.getElementsByTagName('sdcard')[0]
-            data['sd_size'] = sdcard.getAttribute('sd_size')
-            release = Release(**data)
-            self[release.project_id] = release
+        root, data = None, None
+        for event, element in xml.etree.ElementTree.iterparse(
+                                        filename, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif element.tag == 'release':
+                    data = {name: element.get(name, '')
+                            for name in schema['release']}
+            elif data is None:
+                continue
+            elif element.tag in fields:
+                data[element.tag] = (element.text or '').strip()
+            elif element.tag == 'sdcard':
+                data.update({name: element.get(name, '')
+                             for name in schema['sdcard']})
+            elif element.tag == 'release':
+                release = Release(**data)
+                self[release.project_id] = release
+                data = None
+                # Drop the parsed release, memory does not grow with the file.
+                root.clear()
         if any(self.keys()):
             return True
         else:
@@ -971,69 +2023,67 @@ Size: {0.sd_size}
     <td><xsl:value-of select="./feature_jibbigo"/></td>
 </xsl:template>
 <xsl:template match="sdcard">
-    <td class="dimmed"><xsl:value-of select="@sd_size"/></td>
+    <td class="dimmed" title="{@sd_folders}"
+        ><xsl:value-of select="@sd_size"/></td>
 </xsl:template>
 </xsl:stylesheet>"""
-        with open(filename, mode='w') as fp:
+        with atomic_writer(filename) as fp:
             fp.write(xslt)
 
 
     def export_xml(self, filename):
-        root = xml.etree.ElementTree.Element("releases")
-        for release in self.values():
-            try:
-                element = xml.etree.ElementTree.Element(
-                                    "release", project_id=release.project_id,
-                                    project_model=release.project_model)
-                apps_ectaco = xml.etree.ElementTree.SubElement(
-                                                       element, "apps_ectaco")
-                apps_ectaco.text = release.apps_ectaco
-                apps_other = xml.etree.ElementTree.SubElement(
-                                                      element, "apps_other")
-                apps_other.text = release.apps_other
-                voice_dictionary = xml.etree.ElementTree.SubElement(
-                                                element, "voice_dictionary")
-                voice_dictionary.text = release.voice_dictionary
-                voice_phrasebook = xml.etree.ElementTree.SubElement(
-                                                element, "voice_phrasebook")
-                voice_phrasebook.text = release.voice_phrasebook
-                photo_text = xml.etree.ElementTree.SubElement(
-                                                      element, 'photo_text')
-                photo_text.text = release.photo_text
-                ulearn = xml.etree.ElementTree.SubElement(element, 'ulearn')
-                ulearn.text = release.ulearn
-                ulearn2 = xml.etree.ElementTree.SubElement(element, 'ulearn2')
-                ulearn2.text = release.ulearn2
-                features = xml.etree.ElementTree.SubElement(
-                                                    element, "features")
-                feature_tts = xml.etree.ElementTree.SubElement(
-                                                       features, "feature_tts")
-                feature_tts.text = release.feature_tts
-                feature_sr = xml.etree.ElementTree.SubElement(
-                                                      features, "feature_sr")
-                feature_sr.text = release.feature_sr
-                feature_gt = xml.etree.ElementTree.SubElement(
-                                                      features, "feature_gt")
-                feature_gt.text = release.feature_gt
-                feature_jibbigo = xml.etree.ElementTree.SubElement(
-                                               features, "feature_jibbigo")
-                feature_jibbigo.text = release.feature_jibbigo
-                xml.etree.ElementTree.SubElement(
-                                 element, "sdcard", sd_size=release.sd_size)
-                root.append(element)
-            except AttributeError as err:
-                logger.error(err)
-                # etree -> DOM for pretty output
-        dom = xml.dom.minidom.parseString(
-                  xml.etree.ElementTree.tostring(root, encoding="UTF-8"))
+        schema = collections.defaultdict(list)
+        for name, place in Release.SCHEMA:
+            schema[place].append(name)
+
+        def render(release):
+            text = io.StringIO()
+            w = xml.sax.saxutils.XMLGenerator(text, short_empty_elements=True)
+
+            def element(name, level):
+                w.ignorableWhitespace('\t' * level)
+                w.startElement(name, {})
+                w.characters(getattr(release, name))
+                w.endElement(name)
+                w.ignorableWhitespace('\n')
+
+            def attributes(place):
+                return {name: getattr(release, name) for name in schema[place]}
+
+            w.ignorableWhitespace('\t')
+            w.startElement('release', attributes('release'))
+            w.ignorableWhitespace('\n')
+            for name in schema['element']:
+                element(name, 2)
+            w.ignorableWhitespace('\t\t')
+            w.startElement('features', {})
+            w.ignorableWhitespace('\n')
+            for name in schema['features']:
+                element(name, 3)
+            w.ignorableWhitespace('\t\t')
+            w.endElement('features')
+            w.ignorableWhitespace('\n\t\t')
+            w.startElement('sdcard', attributes('sdcard'))
+            w.endElement('sdcard')
+            w.ignorableWhitespace('\n\t')
+            w.endElement('release')
+            w.ignorableWhitespace('\n')
+            return text.getvalue()
+
         xsl = ".".join((str(os.path.splitext(filename)[0]), "xslt"))
-        ins = dom.createProcessingInstruction('xml-stylesheet',
-                          'type="text/xsl" href="%s"' % os.path.basename(xsl))
-        r = dom.firstChild
-        dom.insertBefore(ins, r)
-        with open(filename, mode='w') as fp:
-            fp.write(dom.toprettyxml())
-            self._export_xsl(xsl)
+        with atomic_writer(filename) as fp:
+            # The same prolog as minidom writes, the XSLT expects it.
+            w = xml.sax.saxutils.XMLGenerator(fp)
+            fp.write('<?xml version="1.0" ?>\n')
+            w.processingInstruction('xml-stylesheet', 'type="text/xsl" '
+                                    'href="%s"' % os.path.basename(xsl))
+            w.ignorableWhitespace('\n')
+            w.startElement('releases', {})
+            w.ignorableWhitespace('\n')
+            fp.writelines(self._render('.xml', render))
+            w.endElement('releases')
+            w.ignorableWhitespace('\n')
+        self._export_xsl(xsl)
 
 
     def export_html(self, filename):
@@ -1052,8 +2102,7 @@ Size: {0.sd_size}
 <meta http-equiv="Content-Script-Type" content="application/javascript" />
 <link rel="stylesheet" href="style.css" />
 </head><body>
-<h3>Release Summary</h3>
-<table>"""
+"""
         table_header = """<tr>
 <td class="header">No.</td>
 <td class="header">File Name</td>
@@ -1073,40 +2122,264 @@ Size: {0.sd_size}
 </tr>"""
         
         f = xml.sax.saxutils.escape
-        with open(filename, mode='w') as fp:
-            fp.write(page_header)
-            for i, release in enumerate(self.values()):
-                t = list()
-                s = f(release.project_id)
-                t.append('<tr>\n<td align="right">%i</td>' % (i + 1))
-                if ReleaseCollection._TESTING.search(
-                  release.project_id) is not None:
-                    t.append('<td>%s</td>' % f(release.project_id))
-                elif release.project_id.startswith('lux2'):
-                    t.append('<td><a href="{0}">{1}</a></td>'.format(
-                             '/'.join((ReleaseCollection._LUX, s)), s))
-                elif release.project_id.startswith('SG_'):
-                    t.append('<td><a href="{0}">{1}</a></td>'.format(
-                             '/'.join((ReleaseCollection._SG, s)), s))
-                else:
-                    t.append('<td>%s</td>' % f(release.project_id))
-                t.append('<td>%s</td>' % f(release.project_model))
-                t.append('<td>%s</td>' % nbsp(f(release.apps_ectaco)))
-                t.append('<td>%s</td>' % nbsp(f(release.apps_other)))
-                t.append('<td>%s</td>' % nbsp(f(release.voice_dictionary)))
-                t.append('<td>%s</td>' % nbsp(f(release.voice_phrasebook)))
-                t.append('<td>%s</td>' % f(release.photo_text))
-                t.append('<td>%s</td>' % nbsp(f(release.ulearn)))
-                t.append('<td>%s</td>' % nbsp(f(release.ulearn2)))
-                t.append('<td>%s</td>' % f(release.feature_tts))
-                t.append('<td>%s</td>' % f(release.feature_sr))
-                t.append('<td>%s</td>' % nbsp(f(release.feature_gt)))
-                t.append('<td>%s</td>' % nbsp(f(release.feature_jibbigo)))
-                t.append('<td align="center" class="dimmed">%s</td>' % 
-                        nbsp(f(release.sd_size)))
-                t.append('\n</tr>')
-                fp.write(table_header + '\n'.join(t))
+
+        def render(release):
+            t = list()
+            s = f(release.project_id)
+            if ReleaseCollection._TESTING.search(
+              release.project_id) is not None:
+                t.append('<td>%s</td>' % f(release.project_id))
+            elif release.project_id.startswith('lux2'):
+                t.append('<td><a href="{0}">{1}</a></td>'.format(
+                         '/'.join((ReleaseCollection._LUX, s)), s))
+            elif release.project_id.startswith('SG_'):
+                t.append('<td><a href="{0}">{1}</a></td>'.format(
+                         '/'.join((ReleaseCollection._SG, s)), s))
+            else:
+                t.append('<td>%s</td>' % f(release.project_id))
+            t.append('<td>%s</td>' % f(release.project_model))
+            t.append('<td>%s</td>' % nbsp(f(release.apps_ectaco)))
+            t.append('<td>%s</td>' % nbsp(f(release.apps_other)))
+            t.append('<td>%s</td>' % nbsp(f(release.voice_dictionary)))
+            t.append('<td>%s</td>' % nbsp(f(release.voice_phrasebook)))
+            t.append('<td>%s</td>' % f(release.photo_text))
+            t.append('<td>%s</td>' % nbsp(f(release.ulearn)))
+            t.append('<td>%s</td>' % nbsp(f(release.ulearn2)))
+            t.append('<td>%s</td>' % f(release.feature_tts))
+            t.append('<td>%s</td>' % f(release.feature_sr))
+            t.append('<td>%s</td>' % nbsp(f(release.feature_gt)))
+            t.append('<td>%s</td>' % nbsp(f(release.feature_jibbigo)))
+            t.append('<td align="center" class="dimmed" title=%s>%s</td>' %
+                     (xml.sax.saxutils.quoteattr(release.sd_folders),
+                      nbsp(f(release.sd_size))))
+            t.append('\n</tr>')
+            return '\n'.join(t)
+
+        # The row number is not a part of the fragment, it changes whenever
+        # a release is added or removed before this one.
+        rows = self._render('.html', render)
+        if self.pages:
+            self._export_html_pages(filename, page_header, table_header, rows)
+        else:
+            with atomic_writer(filename) as fp:
+                fp.write(page_header + '<h3>Release Summary</h3>\n<table>')
+                for i, row in enumerate(rows):
+                    fp.write(table_header +
+                             '<tr>\n<td align="right">%i</td>\n' % (i + 1) +
+                             row)
+                fp.write('</table>\n</body>\n</html>')
+        if self.view:
+            self._export_html_view(filename)
+
+
+    def _export_html_pages(self, filename, page_header, table_header, rows):
+        """Write the rows to pages, the index of the pages to filename"""
+        f = xml.sax.saxutils.escape
+        base = os.path.splitext(filename)[0]
+        # All the rows: _render keeps the fragments only when they run out.
+        rows = list(rows)
+        pages = collections.OrderedDict()
+        for i, (project_id, row) in enumerate(zip(self.keys(), rows)):
+            if self.pages == 'prefix':
+                key = project_id.split('_', 1)[0].lower()
+            else:
+                key = str(i // self.pages + 1)
+            pages.setdefault(key, []).append((i, project_id, row))
+        names = collections.OrderedDict(
+            (key, '%s_page_%s.html' % (os.path.basename(base), key))
+            for key in pages)
+        keys = list(pages)
+        for n, key in enumerate(keys):
+            page = pages[key]
+            if self.pages == 'prefix':
+                title = key
+            else:
+                title = '%i-%i' % (page[0][0] + 1, page[-1][0] + 1)
+            links = ['<a href="%s">Index</a>' % os.path.basename(filename)]
+            if n:
+                links.append('<a href="%s">Previous</a>' % names[keys[n - 1]])
+            if n + 1 < len(keys):
+                links.append('<a href="%s">Next</a>' % names[keys[n + 1]])
+            nav = '<p>%s</p>\n' % ' | '.join(links)
+            with atomic_writer(os.path.join(os.path.dirname(filename),
+                                            names[key])) as fp:
+                fp.write(page_header)
+                fp.write('<h3>Release Summary: %s</h3>\n' % f(title))
+                fp.write(nav + '<table>' + table_header)
+                fp.writelines('<tr>\n<td align="right">%i</td>\n' % (i + 1) +
+                              row for i, _, row in page)
+                fp.write('</table>\n' + nav + '</body>\n</html>')
+        with atomic_writer(filename) as fp:
+            fp.write(page_header + """<h3>Release Summary</h3>
+<table><tr>
+<td class="header">Page</td>
+<td class="header">Releases</td>
+<td class="header">First</td>
+<td class="header2">Last</td>
+</tr>""")
+            for key in keys:
+                page = pages[key]
+                fp.write('<tr><td><a href="%s">%s</a></td><td align="right">'
+                         '%i</td><td>%s</td><td>%s</td></tr>\n' % (
+                          names[key], f(key), len(page), f(page[0][1]),
+                          f(page[-1][1])))
             fp.write('</table>\n</body>\n</html>')
+        # The pages left from a longer report
+        folder = os.path.dirname(filename) or '.'
+        prefix = os.path.basename(base) + '_page_'
+        for name in os.listdir(folder):
+            if (name.startswith(prefix) and name.endswith('.html') and
+                    name not in names.values()):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError as err:
+                    logger.error(err)
+
+
+    def _export_html_view(self, filename):
+        """Write the releases as a JSON blob into a page which renders
+        only the rows scrolled into view"""
+        data = json.dumps({'fields': Release.FIELDS,
+                           'rows': [[getattr(release, field)
+                                     for field in Release.FIELDS]
+                                    for release in self.values()]},
+                          separators=(',', ':')).replace('</', '<\\/')
+        page = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8" />
+<title>Release Summary</title>
+<link rel="stylesheet" href="style.css" />
+<style>
+#view { height: 90vh; overflow-y: auto; }
+#view td { height: 18px; max-width: 24em; white-space: nowrap;
+           overflow: hidden; text-overflow: ellipsis; }
+</style></head><body>
+<h3>Release Summary</h3>
+<div id="view"><table><thead id="head"></thead><tbody id="rows"></tbody>
+</table></div>
+<script type="application/json" id="data">%s</script>
+<script>
+var data = JSON.parse(document.getElementById('data').textContent);
+var view = document.getElementById('view');
+var body = document.getElementById('rows');
+var height = 29, extra = 20;
+function esc(s) {
+    return s.replace(/&/g, '&amp;').replace(/</g, '&lt;')
+            .replace(/"/g, '&quot;');
+}
+document.getElementById('head').innerHTML = '<tr><td class="header">No.' +
+    '</td>' + data.fields.map(function (f) {
+        return '<td class="header">' + esc(f) + '</td>'; }).join('') +
+    '</tr>';
+function draw() {
+    var first = Math.max(0, Math.floor(view.scrollTop / height) - extra);
+    var last = Math.min(data.rows.length,
+        first + Math.ceil(view.clientHeight / height) + 2 * extra);
+    var html = ['<tr style="height:' + first * height + 'px"></tr>'];
+    for (var i = first; i < last; i++) {
+        html.push('<tr><td align="right">' + (i + 1) + '</td>' +
+            data.rows[i].map(function (c) {
+                return '<td title="' + esc(c) + '">' + esc(c) + '</td>';
+            }).join('') + '</tr>');
+    }
+    html.push('<tr style="height:' + (data.rows.length - last) * height +
+              'px"></tr>');
+    body.innerHTML = html.join('');
+}
+view.addEventListener('scroll', draw);
+window.addEventListener('resize', draw);
+draw();
+</script>
+</body></html>
+""" % data
+        with atomic_writer('_'.join((os.path.splitext(filename)[0],
+                                     'view.html')), encoding='utf8') as fp:
+            fp.write(page)
+
+
+    def _render(self, ext, render):
+        """Yield the text of releases in order
+
+        In a complete export the texts are kept for the next one. In the
+        incremental mode only the dirty and the new releases are rendered,
+        the others are taken from the previous export. Otherwise nothing is
+        kept, each release is rendered when it is written.
+        """
+        if self._fragments is None:
+            yield from (render(release) for release in self.values())
+            return
+        previous = self._fragments.get(ext, {})
+        fragments = collections.OrderedDict()
+        for release in self.values():
+            project_id = release.project_id
+            if project_id in self.dirty or project_id not in previous:
+                fragments[project_id] = render(release)
+            else:
+                fragments[project_id] = previous[project_id]
+            yield fragments[project_id]
+        self._fragments[ext] = fragments
+
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _renderer():
+        """SHA-1 of the templates and the code which renders the releases
+
+        The fragments of another renderer are not reused: a new template
+        or field would be missing from the old rows.
+        """
+        sha1 = hashlib.sha1(repr((Release.SCHEMA,
+                                  ReleaseCollection._TEXT)).encode('utf8'))
+
+        def add(code):
+            sha1.update(code.co_code)
+            for const in code.co_consts:
+                if hasattr(const, 'co_code'):
+                    add(const)
+                elif isinstance(const, frozenset):
+                    # The order of a set changes from process to process.
+                    sha1.update(repr(sorted(map(repr, const))).encode('utf8'))
+                else:
+                    sha1.update(repr(const).encode('utf8'))
+
+        for function in (ReleaseCollection.export_xml,
+                         ReleaseCollection.export_html,
+                         ReleaseCollection.write_text,
+                         ReleaseCollection.export_json,
+                         ReleaseCollection._text_wrapper):
+            add(function.__code__)
+        return sha1.hexdigest()
+
+
+    def _load_fragments(self, filename):
+        self._fragments = {}
+        if not self.incremental or not os.access(filename, os.F_OK):
+            return
+        try:
+            with open(filename, 'r', encoding='utf8') as fp:
+                store = json.load(fp)
+        except (OSError, ValueError) as err:
+            logger.warning('Cannot load "%s": %s' % (filename, err))
+            return
+        if (isinstance(store, dict) and
+                store.get('renderer') == ReleaseCollection._renderer()):
+            self._fragments = store.get('fragments', {})
+        else:
+            logger.info('Render all releases, "%s" is of another version' %
+                        os.path.basename(filename))
+
+
+    def _save_fragments(self, filename):
+        try:
+            with atomic_writer(filename, encoding='utf8') as fp:
+                json.dump({'renderer': ReleaseCollection._renderer(),
+                           'fragments': self._fragments}, fp)
+        except OSError as err:
+            logger.error("OS error: {0}".format(err))
+            # Better none than a store behind the report
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
 
 
     def __import_dir(self, folder):
@@ -1115,38 +2388,113 @@ Size: {0.sd_size}
                  os.listdir(folder) if f.lower().startswith(
                         ReleaseCollection._PEFIXES))
         logger.info('Analyze folder "%s"' % os.path.basename(folder))
-        for f in files:
-            self.__import_file(f)
+        self.__import_files(files)
+
+
+    def __import_files(self, filenames):
+        filenames = [f for f in filenames if os.path.splitext(f)[1].lower()
+                     in ReleaseCollection._ARCHIVES]
+        if self.cache is not None and not self.force:
+            pending = []
+            for f in filenames:
+                data = self.cache.get(f)
+                if data is None:
+                    pending.append(f)
+                else:
+                    logger.info('Use cache for "%s"' % os.path.basename(f))
+                    with METRICS.stage('cache', os.path.basename(f)) as r:
+                        r['files'] = 1
+                    self[os.path.basename(f)] = Release(**data)
+                    self.dirty.add(os.path.basename(f))
+            filenames = pending
+        if self.workers > 1 and len(filenames) > 1:
+            # Every Analizer unpacks into its own TempDir and mounts images
+            # on its own ExtDir, so the archives are independent of each other.
+            # They share the scratch budget of this process.
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    initargs=(SCRATCH, METRICS.walk)) as pool:
+                for f, (data, records) in zip(filenames,
+                                              pool.map(_analyze, filenames)):
+                    METRICS.records.extend(records)
+                    self.__add(f, data)
+        else:
+            for f in filenames:
+                self.__import_file(f)
 
 
     def __import_file(self, filename):
         ext = os.path.splitext(filename)[1].lower()
-        if ext in ('.7z', '.exe', '.zip'):
+        if ext in ReleaseCollection._ARCHIVES:
             logger.info('Analyze file "%s"' % os.path.basename(filename))
-            self[os.path.basename(filename)] = Release(
-                                                   **Analizer(filename).data)
+            self.__add(filename, Analizer(filename).data)
+
+
+    def __add(self, filename, data):
+        if self.cache is not None:
+            self.cache.put(filename, data)
+        self[os.path.basename(filename)] = Release(**data)
+        self.dirty.add(os.path.basename(filename))
+
+
+    def __import_report(self, filename):
+        """Load the last export, the snapshot of it when it is up to date"""
+        snapshot = ReleaseSnapshot.filename(filename)
+        try:
+            if (os.access(snapshot, os.F_OK) and (
+                    not os.access(filename, os.F_OK) or
+                    os.path.getmtime(snapshot) >= os.path.getmtime(filename))):
+                return self.import_(snapshot)
+        except (OSError, ValueError, IndexError) as err:
+            logger.warning('Cannot load "%s": %s' % (snapshot, err))
+        return self.import_(filename)
 
 
     def refresh(self, folder='', filename=''):
         source = False
-        if os.access(filename, os.F_OK):
-            self.import_(filename)
+        report = os.access(filename, os.F_OK) or os.access(
+                            ReleaseSnapshot.filename(filename), os.F_OK)
+        if report and not self.force:
+            self.__import_report(filename)
             keys = set(self.keys())
             files = {f for f in
                  os.listdir(folder) if f.lower().startswith(
                         ReleaseCollection._PEFIXES)}
-            if keys > files:
-                for k in (k for k in self.keys() if k not in files):
-                    self.pop(k, None)
+            # The archives gone, even if others were added meanwhile
+            for k in keys - files:
+                self.pop(k, None)
+                self.dirty.add(k)
             files -= set(self.keys())
-            for f in files:
-                self.__import_file(os.path.join(folder, f))
+            self.__import_files(os.path.join(folder, f) for f in files)
             source = True
         else:
             self.clear()
             if os.path.exists(folder):
                 self.import_(folder)
                 source = True
+        self.__save(folder, filename, source)
+
+
+    def update_files(self, folder, filename, names):
+        """Analyze the new and changed archives, drop the removed ones"""
+        paths = []
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.access(path, os.F_OK):
+                paths.append(path)
+            elif name in self:
+                logger.info('Remove "%s"' % name)
+                self.pop(name)
+                self.dirty.add(name)
+        self.__import_files(paths)
+        self.__save(folder, filename, True)
+
+
+    def __save(self, folder, filename, source):
+        if self.cache is not None and os.path.isdir(folder):
+            self.cache.retain(os.path.join(folder, f)
+                              for f in os.listdir(folder))
+            self.cache.save()
         if source:
             if self.export(filename, complete=True):
                 logger.info('OK')
@@ -1156,17 +2504,768 @@ Size: {0.sd_size}
             logger.info('NOTHING TO DO')
 
 
-def main():
+class Daemon(object):
+    """Watch the task folders and keep their reports up to date
+
+    An archive is analyzed when its size and mtime have not changed for
+    settle seconds, i.e. it is not being copied anymore. The folders are
+    polled every interval seconds; with kqueue a new or a removed file
+    wakes the daemon up at once.
+    """
+    def __init__(self, tasks, interval=60, settle=120, **options):
+        self._tasks = tasks
+        self._interval = interval
+        self._settle = settle
+        self._options = options
+        self._collections = {}
+        self._known = {}
+        self._pending = {}
+
+
+    @staticmethod
+    def _snapshot(folder):
+        """{name: (size, mtime)} of the archives in the folder"""
+        result = {}
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if (name.lower().startswith(ReleaseCollection._PEFIXES)
+                            and os.path.splitext(name)[1].lower()
+                            in ReleaseCollection._ARCHIVES):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        result[name] = (st.st_size, st.st_mtime)
+        except OSError as err:
+            logger.error(err)
+        return result
+
+
+    @staticmethod
+    def _save_metrics(report):
+        """Append the records to the metrics file and forget them"""
+        METRICS.save('_'.join((os.path.splitext(report)[0], 'metrics.jsonl')))
+        METRICS.clear()
+
+
+    def start(self):
+        """The first full refresh of every task"""
+        for folder, report in self._tasks.items():
+            cache = AnalysisCache(
+                '_'.join((os.path.splitext(report)[0], 'cache.jsonl')),
+                self._options.get('digest', False))
+            task = ReleaseCollection(
+                        workers=self._options.get('workers', 1), cache=cache,
+                        force=self._options.get('force', False),
+                        incremental=True,
+                        pages=self._options.get('pages', 0),
+                        view=self._options.get('view', False))
+            task.refresh(folder, report)
+            Daemon._save_metrics(report)
+            self._collections[folder] = task
+            self._known[folder] = Daemon._snapshot(folder)
+            self._pending[folder] = {}
+
+
+    def check(self, now=None):
+        """Update the reports of the folders with settled changes"""
+        now = time.time() if now is None else now
+        for folder, report in self._tasks.items():
+            known, pending = self._known[folder], self._pending[folder]
+            current = Daemon._snapshot(folder)
+            ready = []
+            for name in set(current) | set(known):
+                signature = current.get(name)
+                if signature == known.get(name):
+                    pending.pop(name, None)
+                elif name not in pending or pending[name][0] != signature:
+                    pending[name] = (signature, now)
+                elif now - pending[name][1] >= self._settle:
+                    ready.append(name)
+            if not ready:
+                continue
+            logger.info('Update "%s": %s' % (os.path.basename(folder),
+                                             ', '.join(sorted(ready))))
+            self._collections[folder].update_files(folder, report, ready)
+            Daemon._save_metrics(report)
+            for name in ready:
+                signature = pending.pop(name)[0]
+                if signature is None:
+                    known.pop(name, None)
+                else:
+                    known[name] = signature
+
+
+    def run(self):
+        self.start()
+        kqueue = getattr(select, 'kqueue', None)
+        queue, fds = None, []
+        if kqueue is not None:
+            queue = kqueue()
+            for folder in self._tasks:
+                fd = os.open(folder, os.O_RDONLY)
+                fds.append(fd)
+                queue.control([select.kevent(
+                    fd, filter=select.KQ_FILTER_VNODE,
+                    flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                    fflags=select.KQ_NOTE_WRITE)], 0)
+        try:
+            while True:
+                # Come back sooner while something is being copied.
+                timeout = self._interval
+                if any(self._pending.values()):
+                    timeout = min(timeout, max(1, self._settle / 4))
+                if queue is not None:
+                    queue.control(None, len(fds), timeout)
+                else:
+                    time.sleep(timeout)
+                self.check()
+        finally:
+            for fd in fds:
+                os.close(fd)
+            if queue is not None:
+                queue.close()
+
+
+class ReleaseDiff(object):
+    """What changed between the releases of two reports and between the
+    consecutive releases of every product line
+
+    A snapshot is {project_id: {field: value}} where a comma-joined facet
+    is parsed once into a frozenset; the equal facets of different
+    releases share one frozenset.
+    """
+    FACETS = tuple(f for f in Release.FIELDS
+                   if f in Analizer._FACETS.values())
+    SCALARS = ('project_model', 'sd_size', 'sd_folders')
+    # The date in SG_20131129_Russian.exe or lux2_en_ru_13_10_10_ics.exe
+    _DATE = re.compile(r'(?:^|_)(\d{8}|\d\d_\d\d_\d\d)(?=_|$)')
+    # The tokens which do not make a different product line
+    _VARIANTS = frozenset(('ics', 'jb', 'testing', 'test', 'eval'))
+
+
+    def __init__(self, new, old=None):
+        """new and old are snapshots or anything snapshot() takes"""
+        self.new = ReleaseDiff.snapshot(new)
+        self.old = None if old is None else ReleaseDiff.snapshot(old)
+
+
+    @staticmethod
+    def snapshot(source):
+        """The snapshot of a ReleaseCollection, an AnalysisCache or a file
+
+        The file is a JSON or XML report, a snapshot of one or a JSON-lines
+        analysis cache.
+        """
+        if isinstance(source, str):
+            if source.lower().endswith('.jsonl'):
+                source = AnalysisCache(source)
+            else:
+                collection = ReleaseCollection()
+                if not collection.import_(source):
+                    raise ValueError('Cannot load "%s"' % source)
+                source = collection
+        if isinstance(source, AnalysisCache):
+            releases = ((k, Release(**v)) for k, v in
+                        source.releases().items())
+        elif isinstance(source, ReleaseCollection):
+            releases = source.items()
+        else:
+            return source
+        parsed = {'-': frozenset()}
+        blank = frozenset(('',))
+
+        def parse(value):
+            result = parsed.get(value)
+            if result is None:
+                result = parsed[value] = frozenset(
+                            map(str.strip, value.split(','))) - blank
+            return result
+
+        snapshot = {}
+        for project_id, release in releases:
+            fields = {f: parse(getattr(release, f))
+                      for f in ReleaseDiff.FACETS}
+            fields.update({f: getattr(release, f)
+                           for f in ReleaseDiff.SCALARS})
+            snapshot[project_id] = fields
+        return snapshot
+
+
+    @staticmethod
+    def product_line(project_id):
+        """(product line, date) of the release file name
+
+        The line is the name without the extension, the date and the
+        variant tokens; the date is YYYYMMDD or '' if there is none.
+        """
+        name = os.path.splitext(project_id)[0]
+        match = ReleaseDiff._DATE.search(name)
+        if match is None:
+            return name, ''
+        date = match.group(1).replace('_', '')
+        if len(date) == 6:
+            date = '20' + date
+        rest = (name[:match.start()] + '_' + name[match.end():]).split('_')
+        return ('_'.join(t for t in rest
+                         if t and t.lower() not in ReleaseDiff._VARIANTS),
+                date)
+
+
+    @staticmethod
+    def changes(old, new):
+        """{field: change} of the fields which differ
+
+        The change of a facet is {'added': [...], 'removed': [...]}, the
+        change of another field is {'old': value, 'new': value}.
+        """
+        result = {}
+        for f in ReleaseDiff.FACETS:
+            a, b = old[f], new[f]
+            if a is not b and a != b:
+                result[f] = {'added': sorted(b - a, key=str.lower),
+                             'removed': sorted(a - b, key=str.lower)}
+        for f in ReleaseDiff.SCALARS:
+            if old[f] != new[f]:
+                result[f] = {'old': old[f], 'new': new[f]}
+        return result
+
+
+    def lines(self):
+        """Yield (line, old id, new id, changes) of the consecutive
+        releases of every product line in the new snapshot"""
+        by_line = collections.defaultdict(list)
+        for project_id in self.new:
+            line, date = ReleaseDiff.product_line(project_id)
+            by_line[line].append((date, project_id))
+        for line in sorted(by_line, key=str.lower):
+            releases = [p for _, p in sorted(by_line[line])]
+            for a, b in zip(releases, releases[1:]):
+                yield line, a, b, ReleaseDiff.changes(self.new[a],
+                                                      self.new[b])
+
+
+    def compare(self):
+        """(added ids, removed ids, {id: changes}) from old to new"""
+        if self.old is None:
+            return [], [], {}
+        new, old = set(self.new), set(self.old)
+        changed = {}
+        for project_id in sorted(new & old):
+            c = ReleaseDiff.changes(self.old[project_id],
+                                    self.new[project_id])
+            if c:
+                changed[project_id] = c
+        return sorted(new - old), sorted(old - new), changed
+
+
+    def as_dict(self):
+        added, removed, changed = self.compare()
+        return {'added': added, 'removed': removed, 'changed': changed,
+                'lines': [{'line': line, 'old': a, 'new': b,
+                           'changes': c} for line, a, b, c in self.lines()]}
+
+
+    def export(self, filename):
+        ext = os.path.splitext(filename)[1].lower()
+        call = {'.json': self.export_json,
+                '.htm': self.export_html,
+                '.html': self.export_html}
+        if ext not in call:
+            logger.warning(
+                '"%s" is not a format. Known formats are JSON and HTML.' % ext)
+            return False
+        logger.info('Export diff to "%s"' % os.path.basename(filename))
+        call[ext](filename)
+        return True
+
+
+    def export_json(self, filename):
+        with atomic_writer(filename, encoding='utf8') as fp:
+            json.dump(self.as_dict(), fp, indent=1, sort_keys=True)
+
+
+    def export_html(self, filename):
+        f = xml.sax.saxutils.escape
+        diff = self.as_dict()
+
+        def rows(old, new, changes):
+            for field in Release.FIELDS:
+                if field not in changes:
+                    continue
+                c = changes[field]
+                if 'added' in c:
+                    cells = (', '.join(c['added']), ', '.join(c['removed']))
+                else:
+                    cells = (c['new'], c['old'])
+                yield ('<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td>'
+                       '<td>%s</td></tr>' % (f(old), f(new), f(field),
+                                             f(cells[0]), f(cells[1])))
+
+        t = ["""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" lang="en" xml:lang="en">
+<head><title>Release Changes</title>
+<meta http-equiv="content-language" content="en" />
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />
+<link rel="stylesheet" href="style.css" />
+</head><body>"""]
+        header = """<table>
+<tr>
+<td class="header">Old</td>
+<td class="header">New</td>
+<td class="header">Field</td>
+<td class="header">Added / New value</td>
+<td class="header2">Removed / Old value</td>
+</tr>"""
+        if self.old is not None:
+            t.append('<h3>Releases</h3>')
+            t.append('<p>Added: %s</p>' % f(', '.join(diff['added']) or '-'))
+            t.append('<p>Removed: %s</p>' %
+                     f(', '.join(diff['removed']) or '-'))
+            t.append(header)
+            for project_id in sorted(diff['changed']):
+                t.extend(rows(project_id, project_id,
+                              diff['changed'][project_id]))
+            t.append('</table>')
+        line = None
+        for item in diff['lines']:
+            if item['line'] != line:
+                if line is not None:
+                    t.append('</table>')
+                line = item['line']
+                t.append('<h3>%s</h3>' % f(line))
+                t.append(header)
+            t.extend(rows(item['old'], item['new'], item['changes']))
+        if line is not None:
+            t.append('</table>')
+        t.append('</body></html>\n')
+        with atomic_writer(filename, encoding='utf8') as fp:
+            fp.write('\n'.join(t))
+
+
+class ReleaseIndex(object):
+    """The releases which have a facet item, for queries like
+
+        german AND NOT (feature_tts:french OR "Android Keyboard")
+
+    A term is an item of any facet or facet:item, the case is ignored;
+    adjacent terms mean AND. The postings are bitmaps (int) over the
+    sorted project_ids, so a query is a few big-int operations.
+    """
+    _TERMS = re.compile(r'\s*(\(|\)|(?:\w+:)?"[^"]*"|[^\s()]+)')
+
+
+    def __init__(self, releases=(), postings=None):
+        self.releases = list(releases)
+        # {term: bitmap}; a loaded index keeps the hex strings until used
+        self._postings = postings if postings is not None else {}
+
+
+    @staticmethod
+    def filename(report):
+        return '_'.join((os.path.splitext(report)[0], 'index.json'))
+
+
+    @staticmethod
+    def build(collection):
+        """The index of the facets of a ReleaseCollection"""
+        index = ReleaseIndex(collection.keys())
+        positions = collections.defaultdict(list)
+        terms_of = {}
+        for i, release in enumerate(collection.values()):
+            for facet in ReleaseDiff.FACETS:
+                value = getattr(release, facet)
+                terms = terms_of.get((facet, value))
+                if terms is None:
+                    items = {x.strip().lower() for x in value.split(',')}
+                    items.difference_update(('', '-'))
+                    terms = terms_of[facet, value] = [
+                        t for x in items for t in (x, facet + ':' + x)]
+                for term in terms:
+                    positions[term].append(i)
+        # Set the bits in bytes: ORing big ints one by one is quadratic.
+        size = (len(index.releases) + 7) // 8
+        for term, found in positions.items():
+            bits = bytearray(size)
+            for i in found:
+                bits[i >> 3] |= 1 << (i & 7)
+            index._postings[term] = int.from_bytes(bits, 'little')
+        return index
+
+
+    def save(self, filename):
+        postings = {k: v if isinstance(v, str) else '%x' % v
+                    for k, v in self._postings.items()}
+        with atomic_writer(filename, encoding='utf8') as fp:
+            json.dump({'releases': self.releases, 'postings': postings},
+                      fp, sort_keys=True)
+
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'r', encoding='utf8') as fp:
+            d = json.load(fp)
+        return ReleaseIndex(d['releases'], d['postings'])
+
+
+    def lookup(self, term):
+        """The bitmap of the releases which have the term"""
+        bitmap = self._postings.get(term.lower(), 0)
+        if isinstance(bitmap, str):
+            bitmap = self._postings[term.lower()] = int(bitmap, 16)
+        return bitmap
+
+
+    def query(self, expression):
+        """The sorted project_ids matching the expression"""
+        terms = ReleaseIndex._TERMS.findall(expression)
+        if ''.join(terms).replace(' ', '') != expression.replace(' ', ''):
+            raise ValueError('Cannot parse "%s"' % expression)
+        everything = (1 << len(self.releases)) - 1
+        position = 0
+
+        def peek():
+            return terms[position] if position < len(terms) else None
+
+        def take():
+            nonlocal position
+            position += 1
+            return terms[position - 1]
+
+        def either():
+            result = both()
+            while peek() == 'OR':
+                take()
+                result |= both()
+            return result
+
+        def both():
+            result = single()
+            while peek() not in (None, 'OR', ')'):
+                if peek() == 'AND':
+                    take()
+                result &= single()
+            return result
+
+        def single():
+            term = take() if peek() is not None else None
+            if term is None or term in ('AND', 'OR', ')'):
+                raise ValueError('A term is expected in "%s"' % expression)
+            if term == 'NOT':
+                return everything & ~single()
+            if term == '(':
+                result = either()
+                if peek() != ')':
+                    raise ValueError('")" is expected in "%s"' % expression)
+                take()
+                return result
+            return self.lookup(term.replace('"', ''))
+
+        bitmap = either()
+        if peek() is not None:
+            raise ValueError('Unexpected "%s" in "%s"' % (peek(), expression))
+        bits = bin(bitmap)[:1:-1]
+        return [self.releases[i] for i, b in enumerate(bits) if b == '1']
+
+
+class ReleaseSnapshot(object):
+    """The releases in a compact binary file, to reload a report fast
+
+    The layout is columnar. A value is split into tokens on ", ", the
+    tokens are interned in a string table and the values in a value
+    table, so a field is a list of value ids, one per release:
+
+        header      magic, version, fields, releases, strings, values
+        offsets     uint32 * (strings + 1), where the strings end
+        strings     UTF-8, padded to 4 bytes
+        ends        uint32 * (values + 1), where the token lists end
+        tokens      uint32 * ends[-1], the string ids of the values
+        names       uint32 * fields, the string ids of the field names
+        columns     uint32 * releases per field, the value ids
+
+    The numbers are little-endian, the arrays are used straight from the
+    mmap of the file.
+    """
+    _MAGIC = b'LUXS'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sHHIII')
+    _SEPARATOR = ', '
+
+
+    def __init__(self, filename):
+        self._views = []
+        with open(filename, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+
+    def _parse(self):
+        size = len(self._map)
+        if size < ReleaseSnapshot._HEADER.size:
+            raise ValueError('The snapshot is truncated')
+        magic, version, fields, count, strings, values = (
+                        ReleaseSnapshot._HEADER.unpack_from(self._map))
+        if magic != ReleaseSnapshot._MAGIC:
+            raise ValueError('Not a release snapshot')
+        if version != ReleaseSnapshot._VERSION:
+            raise ValueError('Unknown snapshot version %i' % version)
+        position = ReleaseSnapshot._HEADER.size
+
+        def view(length, uint32=True):
+            nonlocal position
+            end = position + (4 * length if uint32 else length)
+            if end > size:
+                raise ValueError('The snapshot is truncated')
+            result = memoryview(self._map)[position:end]
+            self._views.append(result)
+            position = end
+            if not uint32:
+                position += -length % 4
+            elif sys.byteorder == 'little':
+                result = result.cast('I')
+                self._views.append(result)
+            else:
+                result = array.array('I', result)
+                result.byteswap()
+            return result
+
+        self._offsets = view(strings + 1)
+        self._blob = view(self._offsets[-1], uint32=False)
+        self._ends = view(values + 1)
+        self._tokens = view(self._ends[-1])
+        self._strings = None
+        self._values = None
+        self.count = count
+        self.columns = {self.string(i): None for i in view(fields)}
+        for name in self.columns:
+            self.columns[name] = view(count)
+
+
+    def close(self):
+        for view in reversed(self._views):
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        self._map.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def __len__(self):
+        return self.count
+
+
+    def string(self, i):
+        a, b = self._offsets[i], self._offsets[i + 1]
+        return str(self._blob[a:b], 'utf8')
+
+
+    def value(self, i):
+        a, b = self._ends[i], self._ends[i + 1]
+        return ReleaseSnapshot._SEPARATOR.join(
+                                    map(self.string, self._tokens[a:b]))
+
+
+    def values(self, field):
+        """The values of a field of all releases, in order"""
+        if self._values is None:
+            offsets = self._offsets.tolist()
+            strings = [str(self._blob[a:b], 'utf8')
+                       for a, b in zip(offsets, offsets[1:])]
+            ends, tokens = self._ends.tolist(), self._tokens.tolist()
+            join = ReleaseSnapshot._SEPARATOR.join
+            self._values = [
+                strings[tokens[a]] if b - a == 1 else
+                join([strings[t] for t in tokens[a:b]])
+                for a, b in zip(ends, ends[1:])]
+        return list(map(self._values.__getitem__, self.columns[field]))
+
+
+    def releases(self):
+        """Yield the releases in the order they were saved"""
+        if 'project_id' not in self.columns:
+            raise ValueError('The snapshot has no project_id')
+        # The values were stripped by the Release they were saved from.
+        columns = [self.values(f) if f in self.columns else
+                   itertools.repeat('-', self.count) for f in Release.FIELDS]
+        setters = [getattr(Release, f).__set__ for f in Release.FIELDS]
+        for values in zip(*columns):
+            release = Release.__new__(Release)
+            for setter, value in zip(setters, values):
+                setter(release, value)
+            yield release
+
+
+    @staticmethod
+    def filename(report):
+        return '_'.join((os.path.splitext(report)[0], 'snapshot.bin'))
+
+
+    @staticmethod
+    def save(collection, filename):
+        """Write the releases of a ReleaseCollection"""
+        releases = list(collection.values())
+        strings, values = {}, {}
+        ends, tokens = array.array('I', [0]), array.array('I')
+
+        def string(text):
+            return strings.setdefault(text, len(strings))
+
+        def value(text):
+            i = values.get(text)
+            if i is None:
+                i = values[text] = len(values)
+                tokens.extend(map(string, text.split(
+                                            ReleaseSnapshot._SEPARATOR)))
+                ends.append(len(tokens))
+            return i
+
+        names = array.array('I', map(string, Release.FIELDS))
+        columns = [array.array('I', (value(getattr(r, f)) for r in releases))
+                   for f in Release.FIELDS]
+        encoded = [text.encode('utf8') for text in strings]
+        offsets = array.array('I', itertools.accumulate(
+                                    itertools.chain([0], map(len, encoded))))
+        blob = b''.join(encoded)
+        blob += bytes(-len(blob) % 4)
+        header = ReleaseSnapshot._HEADER.pack(
+                    ReleaseSnapshot._MAGIC, ReleaseSnapshot._VERSION,
+                    len(Release.FIELDS), len(releases), len(strings),
+                    len(values))
+        with atomic_writer(filename, 'wb') as fp:
+            fp.write(header)
+            for part in [offsets, blob, ends, tokens, names] + columns:
+                if isinstance(part, array.array):
+                    if sys.byteorder != 'little':
+                        part.byteswap()
+                    part = part.tobytes()
+                fp.write(part)
+
+
+def main(workers=1, force=False, digest=False, incremental=False,
+         daemon=False, interval=60, settle=120, pages=0, view=False,
+         usage=False):
+    METRICS.walk = usage
+    if daemon:
+        signal.signal(signal.SIGTERM, lambda *ignore: sys.exit(0))
+        Daemon(Settings.tasks, interval, settle, workers=workers,
+               force=force, digest=digest, pages=pages, view=view).run()
+        return
     for i in Settings.tasks:
-        task = ReleaseCollection()
-        task.refresh(i, Settings.tasks[i])
+        report = Settings.tasks[i]
+        cache = AnalysisCache(
+            '_'.join((os.path.splitext(report)[0], 'cache.jsonl')), digest)
+        task = ReleaseCollection(workers=workers, cache=cache, force=force,
+                                 incremental=incremental, pages=pages,
+                                 view=view)
+        task.refresh(i, report)
+        METRICS.save(
+            '_'.join((os.path.splitext(report)[0], 'metrics.jsonl')))
+    if METRICS.records:
+        logger.info('Stages:\n' + METRICS.summary())
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze release images.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of archives analyzed in parallel')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='analyze all archives again, ignore the cache')
+    parser.add_argument('--digest', action='store_true',
+                        help='check SHA-1 of archives against the cache')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='render only new and changed releases')
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help='watch the folders and update the reports')
+    parser.add_argument('--interval', type=float, default=60,
+                        help='seconds between folder checks (daemon)')
+    parser.add_argument('--settle', type=float, default=120,
+                        help='seconds an archive must not change (daemon)')
+    parser.add_argument('--html-pages', default='0', metavar='N|prefix',
+                        help='split the HTML report into pages of N '
+                             'releases or a page per prefix')
+    parser.add_argument('--html-view', action='store_true',
+                        help='also write a page rendering only the rows '
+                             'in view')
+    parser.add_argument('--usage', action='store_true',
+                        help='walk the temp folders for the metrics of the '
+                             'disk usage (slow)')
+    parser.add_argument('--diff', nargs='+', metavar='REPORT',
+                        help='[OLD] NEW report or cache: the changes of the '
+                             'releases and of the product lines')
+    parser.add_argument('-o', '--output',
+                        help='JSON or HTML file for --diff (default stdout)')
+    parser.add_argument('-t', '--text', metavar='REPORT',
+                        help='write the JSON or XML report as text to the '
+                             'standard output')
+    parser.add_argument('-q', '--query',
+                        help='the releases matching the query, e.g. '
+                             '\'german AND NOT feature_tts:french\'')
+    parser.add_argument('-r', '--report', action='append',
+                        help='the report to --query (default all reports)')
+    args = parser.parse_args()
+    if args.html_pages != 'prefix':
+        try:
+            args.html_pages = max(0, int(args.html_pages))
+        except ValueError:
+            parser.error('--html-pages takes a number or "prefix"')
+    if args.text:
+        collection = ReleaseCollection()
+        if not os.access(args.text, os.F_OK):
+            parser.error('"%s" not found' % args.text)
+        collection.import_(args.text)
+        try:
+            collection.export_text('-')
+        except BrokenPipeError:
+            # The reader has gone, e.g. head: do not complain at exit.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        sys.exit()
+    if args.query:
+        result = {}
+        for report in args.report or sorted(Settings.tasks.values()):
+            try:
+                index = ReleaseIndex.load(ReleaseIndex.filename(report))
+            except (OSError, ValueError, KeyError):
+                collection = ReleaseCollection()
+                if (not os.access(report, os.F_OK) or
+                        not collection.import_(report)):
+                    continue
+                index = ReleaseIndex.build(collection)
+            try:
+                result[report] = index.query(args.query)
+            except ValueError as err:
+                parser.error(err)
+        json.dump(result, sys.stdout, indent=1, sort_keys=True)
+        sys.exit()
+    if args.diff:
+        if len(args.diff) > 2:
+            parser.error('--diff takes one or two reports')
+        diff = ReleaseDiff(*reversed(args.diff))
+        if args.output:
+            sys.exit(not diff.export(args.output))
+        json.dump(diff.as_dict(), sys.stdout, indent=1, sort_keys=True)
+        sys.exit()
     if sys.platform.startswith('win'):
         logger.warning('It works for FreeBSD')
         sys.exit()
     if os.getuid() == 0:
-        main()
+        main(workers=max(1, args.jobs), force=args.force, digest=args.digest,
+             incremental=args.incremental, daemon=args.daemon,
+             interval=args.interval, settle=args.settle,
+             pages=args.html_pages, view=args.html_view, usage=args.usage)
     else:
         logger.warning('You must be the root to use this script.')